@@ -0,0 +1,152 @@
+"""
+__main__.py
+
+benchmark the sft core over control point and query point counts
+
+    python -m bench -o result.json
+    python -m bench --baseline result.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy
+import scipy
+
+from .cases import CASES
+
+
+def measure(func, repeat):
+    """
+    best and median wall time over `repeat` runs after one untimed warm-up
+    run, and the peak of memory allocated during one more run
+    """
+    # lazy imports, caches and first-touch page faults
+    func()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(times), float(numpy.median(times)), peak
+
+
+def run(args):
+    results = []
+    for name in args.cases:
+        setup, uses_n = CASES[name]
+        for p in args.p:
+            for n in (args.n if uses_n else [None]):
+                kwarg = {}
+                if args.max_bytes and name.endswith('_eval'):
+                    kwarg['max_bytes'] = args.max_bytes
+
+                func = setup(p, n, **kwarg)
+                best, median, peak = measure(func, args.repeat)
+
+                record = {
+                    'case': name,
+                    'p': p,
+                    'n': n,
+                    'time': best,
+                    'median': median,
+                    'throughput': (n if n else p) / best,
+                    'peak_bytes': peak,
+                }
+                results.append(record)
+
+                if not args.quiet:
+                    print(
+                        f'{name:<14} p={p:<7} n={str(n):<8}'
+                        f' {best *1E3:10.2f} ms {record["throughput"]:12.0f} pt/s'
+                        f' {peak /2**20:9.1f} MiB',
+                        file=sys.stderr
+                    )
+
+    return {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'scipy': scipy.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    print the time ratio of every case found in both reports; returns the
+    number of cases slower than `threshold` times the baseline
+    """
+    def key(record):
+        return record['case'], record['p'], record['n']
+
+    base = {key(r): r for r in baseline['results']}
+
+    regressions = 0
+    for record in report['results']:
+        old = base.get(key(record))
+        if old is None:
+            continue
+
+        ratio = record['time'] / old['time']
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+
+        print(
+            f'{record["case"]:<14} p={record["p"]:<7} n={str(record["n"]):<8}'
+            f' {old["time"] *1E3:10.2f} -> {record["time"] *1E3:10.2f} ms'
+            f' x{ratio:5.2f}{flag}'
+        )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('-p', nargs='+', type=int, default=[100, 300, 1000, 3000],
+                        help='numbers of control points')
+    parser.add_argument('-n', nargs='+', type=int, default=[1000, 10000, 100000],
+                        help='numbers of query points')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-bytes', type=int, default=2**28,
+                        help='block budget of the evaluation cases; 0 for none')
+    parser.add_argument('-o', '--output', help='write the report as json')
+    parser.add_argument('--baseline', help='json report to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown over the baseline reported as regression')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=1)
+    elif not args.baseline:
+        json.dump(report, sys.stdout, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        if compare(report, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+cases.py
+
+synthetic data and the benchmarked operations of the sft core
+"""
+import numpy
+
+from demo.formula import get_formula
+
+from sft import Embdding, IsoPSfT, TPS, TpsWarp
+from sft.embedding.tps import pairwise_radial_basis
+
+
+FOCAL = 500
+
+FORMULA = {
+    'formula_x_coef': .05,
+    'formula_x_power': 2,
+    'formula_constant': 30
+}
+
+RANGE = (-10, 10)
+
+
+class GraphEmbedding(Embdding):
+    """
+    Template embedding lifting the parameterization plane onto the graph of
+    a formula
+    """
+
+    def __init__(self, formula):
+        self.formula = formula
+
+    def __call__(self, points) -> numpy.ndarray:
+        points = numpy.array(points, dtype=float).reshape(-1, 2)
+        depth = self.formula.depth(points[:, 0], points[:, 1])
+        return numpy.hstack([points, depth.reshape(-1, 1)])
+
+
+class Problem:
+    """
+    A surface from `demo.formula`, sampled at p control points and n query
+    points of parameterization space, with the matching image points
+    """
+
+    def __init__(self, p, n=None, seed=0):
+        rng = numpy.random.RandomState(seed)
+        self.formula = get_formula(**FORMULA)
+        self.template = GraphEmbedding(self.formula)
+
+        self.control_param, self.control_image = self.sample(rng, p)
+        if n is not None:
+            self.query_param, _ = self.sample(rng, n)
+
+    def sample(self, rng, count):
+        x, y = rng.uniform(*RANGE, size=(2, count))
+        z = self.formula.depth(x, y)
+
+        param = self.formula.param_position(x, y, z)
+        image = FOCAL *numpy.stack([x, y], axis=1) / z[:, None]
+        return param, image
+
+    def warp(self) -> TPS:
+        return TPS(self.control_param, self.control_image)
+
+    def model(self) -> IsoPSfT:
+        return IsoPSfT(self.warp(), self.template, self.control_param)
+
+
+def radial_basis(p, n):
+    problem = Problem(p, n)
+    return lambda: pairwise_radial_basis(problem.query_param, problem.control_param)
+
+
+def tps_fit(p, n=None):
+    problem = Problem(p)
+    return lambda: TPS(problem.control_param, problem.control_image)
+
+
+def tps_eval(p, n, max_bytes=None):
+    problem = Problem(p, n)
+    warp = problem.warp()
+    return lambda: warp(problem.query_param, max_bytes=max_bytes)
+
+
+def warp_reduce(p, n=None, control_points=256):
+    """
+    fit a warp on p matches reduced to `control_points` by grid binning
+    """
+    problem = Problem(p)
+    index = numpy.arange(p)
+    return lambda: TpsWarp.from_arrays(
+        problem.control_param, problem.control_image, index, index, numpy.zeros(p),
+        control_points=control_points)
+
+
+def isopsft_fit(p, n=None):
+    problem = Problem(p)
+    warp = problem.warp()
+    return lambda: IsoPSfT(warp, problem.template, problem.control_param)
+
+
+def isopsft_eval(p, n, max_bytes=None):
+    problem = Problem(p, n)
+    model = problem.model()
+    return lambda: model(problem.query_param, max_bytes=max_bytes)
+
+
+# name -> (setup, whether it depends on n)
+CASES = {
+    'radial_basis': (radial_basis, True),
+    'tps_fit': (tps_fit, False),
+    'tps_eval': (tps_eval, True),
+    'warp_reduce': (warp_reduce, False),
+    'isopsft_fit': (isopsft_fit, False),
+    'isopsft_eval': (isopsft_eval, True),
+}
@@ -0,0 +1,89 @@
+"""
+startup.py
+
+import time regression check of the modules used by headless workers
+
+    python -m bench.startup
+    python -m bench.startup --budget 50
+
+Every module is imported in a fresh interpreter. The check fails when a
+module pulls in one of the `HEAVY` dependencies at import, or when its import
+takes more than `--budget` milliseconds on top of numpy.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+MODULES = ['sft', 'demo.formula', 'demo.pipeline', 'demo.batch']
+
+# loaded on first use only
+HEAVY = [
+    'scipy.linalg',
+    'scipy.spatial',
+    'scipy.special',
+    'concurrent.futures',
+    'matplotlib',
+    'mpl_toolkits',
+    'mpmath',
+    'sympy',
+]
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import numpy
+numpy_time = time.perf_counter() - start
+start = time.perf_counter()
+import {module}
+module_time = time.perf_counter() - start
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps([numpy_time, module_time, heavy]))
+'''
+
+
+def probe(module) -> tuple:
+    """
+    import `module` in a fresh interpreter
+
+    ## Returns
+        + seconds to import numpy
+        + seconds to import the module after numpy
+        + the `HEAVY` modules it loaded
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY)],
+        capture_output=True, text=True, check=True
+    )
+    return tuple(json.loads(result.stdout))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.startup')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=50,
+                        help='allowed import time on top of numpy, in ms')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        runs = [probe(module) for _ in range(args.repeat)]
+        numpy_time = min(r[0] for r in runs)
+        module_time = min(r[1] for r in runs)
+        heavy = sorted(set().union(*(r[2] for r in runs)))
+
+        ok = not heavy and module_time *1E3 <= args.budget
+        failed |= not ok
+
+        print(f'{module:<16} {module_time *1E3:8.1f}ms  (numpy {numpy_time *1E3:.1f}ms)'
+              f'  {"ok" if ok else "FAIL"}')
+        if heavy:
+            print(f'    loads {", ".join(heavy)} at import')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
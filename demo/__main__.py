@@ -3,7 +3,9 @@ __main__.py
 
 enter point + ui
 """
+import argparse
 import sys
+import time
 
 from PyQt5 import QtCore, QtWidgets
 from matplotlib.figure import Figure
@@ -13,16 +15,23 @@ from .main_ui import Ui_MainWindow
 from .gl import SurfaceRenderWidget
 
 from .formula import get_formula
-from .surface import TruthSurface
-from .solution import solve
+from .solution import generate, plot
+from .worker import BackgroundSolver
+
+
+# quiet time of the resolution spin boxes before the surfaces are resampled
+RESOLUTION_DELAY_MS = 150
 
 
 class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
     gtruth = None
+    solution = None
+    shown_key = None
 
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         super().__init__()
+        self.cache_dir = cache_dir
         Ui_MainWindow.setupUi(self, self)
 
         # override
@@ -33,11 +42,23 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.canvas = FigureCanvas(self.fig)
         self.canvas.setParent(self.mplData)
 
+        # solves run on a worker thread
+        self.solver = BackgroundSolver(self)
+        self.solver.progress.connect(self.update_statusbar)
+        self.solver.finished.connect(self.on_solved)
+        self.solver.failed.connect(self.update_statusbar)
+
         # event
         self.btnSolve.clicked.connect(self.on_generate_surface)
 
-        self.sbGlSampX.valueChanged.connect(self.change_gl_resolution)
-        self.sbGlSampY.valueChanged.connect(self.change_gl_resolution)
+        # a burst of resolution changes resamples once, at its last value
+        self.resolution_timer = QtCore.QTimer(self)
+        self.resolution_timer.setSingleShot(True)
+        self.resolution_timer.setInterval(RESOLUTION_DELAY_MS)
+        self.resolution_timer.timeout.connect(self.change_gl_resolution)
+
+        self.sbGlSampX.valueChanged.connect(self.on_resolution_changed)
+        self.sbGlSampY.valueChanged.connect(self.on_resolution_changed)
 
         self.show()
 
@@ -58,29 +79,53 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             formula_constant=self.sbCoefC.value()
         )
 
-        # create surface
-        self.gtruth = TruthSurface(self.formula, xrang, self.sbGlSampX.value(), yrang, self.sbGlSampY.value())
-        self.glGroundTruth.setSurface(self.gtruth)
-
-        # solve
-        self.solution = solve(
-            fig=self.fig,
+        # supersedes a solve in flight
+        self.solve_start = time.perf_counter()
+        self.solver.start(
+            generate,
             formula=self.formula,
             xrang=xrang,
             yrang=yrang,
             xsamp=self.sbNumHorSamp.value(),
             ysamp=self.sbNumVertSamp.value(),
             nsamp=self.sbNumSample.value(),
-            focal=self.sbFocal.value()
+            focal=self.sbFocal.value(),
+            vsamp=(self.sbGlSampX.value(), self.sbGlSampY.value()),
+            cache_dir=self.cache_dir
         )
 
-        self.fig.tight_layout()
-        self.canvas.draw()
+    @QtCore.pyqtSlot(object)
+    def on_solved(self, result):
+        # the resolution may have changed during the solve
+        vsamp = self.sbGlSampX.value(), self.sbGlSampY.value()
 
+        self.gtruth = result['gtruth']
+        if self.gtruth.shape != vsamp[::-1]:
+            self.gtruth.setNumSamp(*vsamp)
+        self.glGroundTruth.setSurface(self.gtruth)
+
+        # a cached solve of what is shown needs no redraw
+        if result['key'] is None or result['key'] != self.shown_key:
+            plot(self.fig, result)
+            self.fig.tight_layout()
+            self.canvas.draw()
+            self.shown_key = result['key']
+
+        elapsed = time.perf_counter() - self.solve_start
+        self.solution = result['surface']
         if self.solution is None:
+            self.update_statusbar(f'{result["error"]} ({elapsed:.1f} s)')
             return
-        self.solution.setNumSamp(self.sbGlSampX.value(), self.sbGlSampY.value())
+
+        if self.solution.shape != vsamp[::-1]:
+            self.solution.setNumSamp(*vsamp)
         self.glResult.setSurface(self.solution)
+        self.update_statusbar(f'solved in {elapsed:.1f} s')
+
+    @QtCore.pyqtSlot()
+    def on_resolution_changed(self):
+        # restarts the countdown of a pending change
+        self.resolution_timer.start()
 
     @QtCore.pyqtSlot()
     def change_gl_resolution(self):
@@ -92,8 +137,18 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.solution.setNumSamp(*vsamp)
             self.glResult.setSurface(self.solution)
 
+    def closeEvent(self, event):
+        self.solver.cancel()
+        self.solver.wait()
+        super().closeEvent(event)
+
 
 if __name__ == '__main__':
-    app = QtWidgets.QApplication(sys.argv)
-    ex = MainWindow()
+    parser = argparse.ArgumentParser(prog='python -m demo')
+    parser.add_argument(
+        '--cache-dir', help='keep solves in this directory across sessions')
+    args, qt_argv = parser.parse_known_args()
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_argv)
+    ex = MainWindow(args.cache_dir)
     sys.exit(app.exec_())
@@ -0,0 +1,229 @@
+"""
+batch.py
+
+headless batch of synthetic reconstructions, for accuracy and performance
+sweeps without a display
+
+    python -m demo.batch configs.json -o results.npz --workers 4
+
+`configs.json` holds a list of configurations, each a dict overriding
+`DEFAULT_CONFIG`. Runs are seeded, by `DEFAULT_SEED` unless a configuration
+sets `seed`; `seed: null` draws a fresh one. The output is an `.npz`
+archive with
+    + `configs` - the configurations as a JSON string
+    + `metrics` - structured array, one row per configuration, with the
+      seed that was used
+    + `points_<i>`, `solution_<i>` and `mask_<i>` - ground truth points,
+      reconstructed points and control point mask of configuration `i`
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy
+
+from .formula import get_formula
+from .pipeline import sample_points, project, normalize, parameterize, solve_warp, solve_sft
+
+
+# seed of the sampled points, so that runs repeat
+DEFAULT_SEED = 0
+
+DEFAULT_CONFIG = {
+    'formula_x_coef': 0.02,
+    'formula_x_power': 2,
+    'formula_constant': 120.,
+    'width': 100.,
+    'height': 100.,
+    'xsamp': 16,
+    'ysamp': 16,
+    'nsamp': 50,
+    'focal': 50.,
+    'seed': DEFAULT_SEED,
+}
+
+STATUS_OK = 0
+STATUS_WARP_FAILED = 1
+STATUS_SFT_FAILED = 2
+
+METRICS_DTYPE = numpy.dtype([
+    ('status', numpy.int8),
+    ('seed', numpy.int64),
+    ('n_points', numpy.int32),
+    ('n_control', numpy.int32),
+    ('rmse', numpy.float64),
+    ('rmse_scaled', numpy.float64),
+    ('max_error_scaled', numpy.float64),
+    ('t_sample', numpy.float64),
+    ('t_warp', numpy.float64),
+    ('t_sft', numpy.float64),
+    ('t_evaluate', numpy.float64),
+    ('t_total', numpy.float64),
+])
+
+
+def errors(estimated, truth):
+    """
+    *assistant func* point-wise errors of the reconstruction, raw and after the
+    least-squares scale alignment (the reconstruction is up to scale)
+
+    ## Returns
+        + rmse
+        + rmse after scale alignment
+        + max error after scale alignment
+    """
+    rmse = numpy.sqrt(numpy.mean(numpy.sum((estimated -truth) **2, axis=1)))
+
+    denom = numpy.sum(estimated *estimated)
+    scale = numpy.sum(estimated *truth) /denom if denom > 0 else 0.
+    dist = numpy.linalg.norm(estimated *scale -truth, axis=1)
+    return rmse, numpy.sqrt(numpy.mean(dist **2)), numpy.max(dist)
+
+
+def run(config) -> tuple:
+    """
+    Run the pipeline of one configuration.
+
+    ## Returns
+        + a record of `METRICS_DTYPE`
+        + ground truth points, float32
+        + reconstructed points, float32; `None` when the pipeline failed
+        + control point mask
+    """
+    config = {**DEFAULT_CONFIG, **config}
+    metrics = numpy.zeros((), dtype=METRICS_DTYPE)
+    metrics[['rmse', 'rmse_scaled', 'max_error_scaled']] = (numpy.nan,) *3
+
+    start = time.perf_counter()
+
+    formula = get_formula(**config)
+    w, h = config['width'], config['height']
+    seed = config['seed']
+    if seed is None:
+        seed = numpy.random.randint(2 **31)
+    metrics['seed'] = seed
+    rng = numpy.random.RandomState(seed)
+
+    apoints_target, mask = sample_points(
+        formula, (-w/2, w/2), (-h/2, h/2),
+        config['xsamp'], config['ysamp'], config['nsamp'], rng)
+    apoints_image = normalize(project(apoints_target, config['focal']), config['focal'])
+    apoints_param, _, _ = parameterize(formula, apoints_target)
+    cpoints_param = apoints_param[mask]
+
+    metrics['n_points'] = len(apoints_target)
+    metrics['n_control'] = mask.sum()
+
+    t = time.perf_counter()
+    metrics['t_sample'] = t -start
+
+    def done(status, solution=None):
+        metrics['status'] = status
+        metrics['t_total'] = time.perf_counter() -start
+        return metrics, apoints_target.astype(numpy.float32), solution, mask
+
+    try:
+        warp = solve_warp(cpoints_param, apoints_image[mask])
+    except numpy.linalg.LinAlgError:
+        return done(STATUS_WARP_FAILED)
+    metrics['t_warp'] = time.perf_counter() -t
+
+    t = time.perf_counter()
+    try:
+        sft = solve_sft(warp, cpoints_param)
+    except numpy.linalg.LinAlgError:
+        return done(STATUS_SFT_FAILED)
+    metrics['t_sft'] = time.perf_counter() -t
+
+    t = time.perf_counter()
+    solution = sft(apoints_param)
+    metrics['t_evaluate'] = time.perf_counter() -t
+
+    metrics[['rmse', 'rmse_scaled', 'max_error_scaled']] = errors(solution, apoints_target)
+    return done(STATUS_OK, solution.astype(numpy.float32))
+
+
+def _preload():
+    """
+    *assistant func* import the modules `sft` loads on first use, so that
+    their import time is not counted in the timings of the first
+    configuration of a process
+    """
+    import scipy.linalg
+    import scipy.linalg.lapack
+    import scipy.spatial.distance
+
+
+def run_batch(configs, workers=None, chunksize=1) -> dict:
+    """
+    Run every configuration, spread over a pool of `workers` processes;
+    serially when `workers` is 1.
+
+    ## Returns
+        the arrays written to the output archive
+    """
+    if workers == 1:
+        _preload()
+        results = map(run, configs)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_preload)
+        results = pool.map(run, configs, chunksize=chunksize)
+
+    try:
+        arrays = {'configs': numpy.array(json.dumps(configs))}
+        metrics = numpy.zeros(len(configs), dtype=METRICS_DTYPE)
+
+        for i, (record, points, solution, mask) in enumerate(results):
+            metrics[i] = record
+            arrays[f'points_{i}'] = points
+            arrays[f'mask_{i}'] = mask
+            if solution is not None:
+                arrays[f'solution_{i}'] = solution
+    finally:
+        if workers != 1:
+            pool.shutdown()
+
+    arrays['metrics'] = metrics
+    return arrays
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m demo.batch',
+        description='Run synthetic shape-from-template reconstructions headless.')
+    parser.add_argument('configs', help='JSON file with a list of configurations')
+    parser.add_argument('-o', '--output', default='results.npz', help='output .npz archive')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes; defaults to the CPU count')
+    parser.add_argument('--chunksize', type=int, default=1,
+                        help='configurations sent to a worker at a time')
+    parser.add_argument('--uncompressed', action='store_true', help='do not compress the archive')
+    args = parser.parse_args(argv)
+
+    with open(args.configs) as f:
+        configs = json.load(f)
+    if isinstance(configs, dict):
+        configs = [configs]
+
+    arrays = run_batch(configs, args.workers, args.chunksize)
+
+    save = numpy.savez if args.uncompressed else numpy.savez_compressed
+    save(args.output, **arrays)
+
+    metrics = arrays['metrics']
+    ok = metrics['status'] == STATUS_OK
+    print(f'{ok.sum()}/{len(metrics)} reconstructed, '
+          f'{metrics["t_total"].sum():.3f}s total -> {args.output}')
+    for i, m in enumerate(metrics):
+        if m['status'] == STATUS_OK:
+            print(f'  [{i}] seed={m["seed"]} rmse(scaled)={m["rmse_scaled"]:.4g} '
+                  f'max={m["max_error_scaled"]:.4g} t={m["t_total"] *1E3:.1f}ms')
+        else:
+            print(f'  [{i}] seed={m["seed"]} failed (status={m["status"]})')
+    return 0 if ok.all() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
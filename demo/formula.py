@@ -8,15 +8,86 @@ from abc import ABC, abstractclassmethod
 import numpy
 
 
+# intervals of the arc length table
+ARC_LENGTH_SAMPLES = 1 << 14
+
+
 class Formula(ABC):
+    """
+    A surface z = depth(x, y) bent along x only, so that the arc length
+    along x and y itself are an isometric parameterization of it
+    """
+
+    _arc_table = None
 
     @abstractclassmethod
     def depth(self, x, y):
         ...
 
-    @abstractclassmethod
+    def params(self) -> dict:
+        """
+        the kind of formula and its coefficients, all that tells its surface
+        apart
+        """
+        params = {k: v for k, v in vars(self).items() if not k.startswith('_')}
+        return {'type': type(self).__name__, **params}
+
     def param_position(self, x, y, z) -> numpy.ndarray:
-        ...
+        """
+        position on parameterization space: the arc length from x = 0, and y;
+        numeric unless the formula knows it in closed form, see `arc_length`
+        """
+        x = numpy.asarray(x, dtype=float).reshape(-1, 1)
+        y = numpy.asarray(y, dtype=float).reshape(-1, 1)
+        return numpy.hstack([self.arc_length(x), y])
+
+    def arc_length(self, x) -> numpy.ndarray:
+        """
+        signed arc length of the surface from x = 0 to every `x`,
+        interpolated on a table of the cumulative trapezoid rule over
+        sqrt(1 + (dz/dx)^2). The table is built on first use and again when
+        `x` leaves its range.
+        """
+        x = numpy.asarray(x, dtype=float)
+        if x.size == 0:
+            return numpy.zeros(x.shape)
+
+        lower = min(numpy.min(x), 0)
+        upper = max(numpy.max(x), 0)
+        if self._arc_table is None \
+                or lower < self._arc_table[0][0] or upper > self._arc_table[0][-1]:
+            # with a margin, so that nearby ranges reuse the table
+            margin = (upper - lower) / 4
+            self._arc_table = self._arc_length_table(lower - margin, upper + margin)
+
+        grid, length = self._arc_table
+        return numpy.interp(x, grid, length)
+
+    def _arc_length_table(self, lower, upper):
+        """
+        *assistant func* cumulative arc length on a uniform grid over
+        [lower, upper], zero at x = 0
+        """
+        grid = numpy.linspace(lower, upper, ARC_LENGTH_SAMPLES +1)
+        dzdx, _ = self.gradient(grid, numpy.zeros(grid.shape))
+        integrand = numpy.sqrt(1 + dzdx **2)
+
+        length = numpy.empty(grid.shape)
+        length[0] = 0
+        numpy.cumsum((integrand[1:] + integrand[:-1]) / 2 *numpy.diff(grid), out=length[1:])
+        length -= numpy.interp(0, grid, length)
+        return grid, length
+
+    def gradient(self, x, y):
+        """
+        partial derivatives of the depth with respect to x and y; central
+        differences unless the formula knows them in closed form
+        """
+        h = 1E-4
+        return (
+            (self.depth(x +h, y) - self.depth(x -h, y)) / (2 *h),
+            (self.depth(x, y +h) - self.depth(x, y -h)) / (2 *h)
+        )
 
 
 def get_formula(**kwarg) -> Formula:
@@ -46,6 +117,9 @@ class QuadraticFormula(Formula):
     def depth(self, x, y):
         return numpy.power(x, 2) *self.coef +self.C
 
+    def gradient(self, x, y):
+        return 2 *self.coef *x, numpy.zeros(numpy.shape(y))
+
     def param_position(self, x, y, z):
         x = x.reshape(-1, 1)
         y = y.reshape(-1, 1)
@@ -68,37 +142,10 @@ class CubedFormula(Formula):
         sign = '+'
         if self.C < 0:
             sign = '-'
-        return f'{coef}x^2 {sign} {abs(self.C)}'
+        return f'{coef}x^3 {sign} {abs(self.C)}'
 
     def depth(self, x, y):
         return numpy.power(x, 3) *self.coef +self.C
 
-    def param_position(self, x, y, z):
-        """
-        see: https://www.wolframalpha.com/input/?i=integral+sqrt(+1%2B(3nx%5E2)%5E2+)
-        """
-        from mpmath import ellipf
-        x = x.reshape(-1).astype(numpy.complex)
-
-        # coefs shortcut
-        n = self.coef
-        ni = numpy.sqrt(n *1j)
-        sq3 = numpy.sqrt(3)
-
-        sq9n2x4 = numpy.sqrt(9 *(n**2) *(x**4) +1)
-
-        # calculation
-        num1 = 27 *(n**3) *(x**5)
-        num2 = 2 *sq3 *sq9n2x4
-
-        num3 = 1j *numpy.arcsinh( sq3 *ni *x )
-        for i, n in enumerate(num3):
-            num3[i] = ellipf(n, -1)
-
-        num4 = 3 *n *x
-
-        den = 9 *n *sq9n2x4
-
-        x = (num1 -num2 *num3 +num4) / den
-        x = numpy.real(x)
-        return numpy.hstack([x.reshape(-1, 1), y.reshape(-1, 1)])
+    def gradient(self, x, y):
+        return 3 *self.coef *numpy.power(x, 2), numpy.zeros(numpy.shape(y))
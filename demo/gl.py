@@ -15,22 +15,25 @@ from .surface import Surface
 FOV = 45
 
 
-class SurfaceRenderWidget(QGLWidget):
+class SurfaceRenderer:
+    """
+    Camera, lighting and drawing of a surface, independent of the window
+    system: every method but `setSurface` needs a current GL context
+    """
 
     surf = None
     min_dist = 0
     lightpos = (0, 0, 0)
 
+    # vertex, normal and index buffer objects of the surface mesh
+    buffers = None
+    n_indices = 0
+    mesh_dirty = False
+
     xRot = 0
     yRot = 0
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        if parent is not None:
-            self.setGeometry(parent.geometry())
-            self.setSizePolicy(parent.sizePolicy())
-
-    def initializeGL(self):
+    def initialize(self, width, height):
         glEnable(GL_DEPTH_TEST)
 
         glClearDepth(1.0)
@@ -38,7 +41,7 @@ class SurfaceRenderWidget(QGLWidget):
         glDepthFunc(GL_LESS)
         glShadeModel(GL_SMOOTH)
 
-        self.resizeGL(self.width(), self.height())
+        self.resize(width, height)
 
         glLightfv(GL_LIGHT1, GL_AMBIENT, (.1, .1, .1, 1))
         glLightfv(GL_LIGHT1, GL_DIFFUSE, (.5, .5, .5, 1))
@@ -48,7 +51,7 @@ class SurfaceRenderWidget(QGLWidget):
 
         glDisable(GL_TEXTURE_2D)
 
-    def resizeGL(self, width, height):
+    def resize(self, width, height):
         glViewport(0, 0, width, height)
 
         glMatrixMode(GL_PROJECTION)
@@ -57,7 +60,7 @@ class SurfaceRenderWidget(QGLWidget):
 
         glMatrixMode(GL_MODELVIEW)
 
-    def paintGL(self):
+    def paint(self):
         if not self.surf:
             return
 
@@ -81,25 +84,56 @@ class SurfaceRenderWidget(QGLWidget):
         )
 
         # draw
-        rows, cols = self.surf.shape
-        for irow in range(rows-1):
-            for icol in range(cols-1):
-                glBegin(GL_QUADS)
-                self.drawVert(irow, icol)
-                self.drawVert(irow+1, icol)
-                self.drawVert(irow+1, icol+1)
-                self.drawVert(irow, icol+1)
-                glEnd()
-
-    def drawVert(self, i, j):
-        element, normal = self.surf[i, j]
-        glNormal3fv(normal)
-        glVertex3fv(element)
+        if self.mesh_dirty:
+            self.uploadMesh()
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffers[0])
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffers[1])
+        glNormalPointer(GL_FLOAT, 0, None)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.buffers[2])
+        glDrawElements(GL_TRIANGLES, self.n_indices, GL_UNSIGNED_INT, None)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def uploadMesh(self):
+        """
+        copy the mesh of the surface into buffer objects, once per surface
+        or resolution
+        """
+        vertices, normals, triangles = self.surf.mesh()
+
+        if self.buffers is None:
+            self.buffers = glGenBuffers(3)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffers[0])
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffers[1])
+        glBufferData(GL_ARRAY_BUFFER, normals.nbytes, normals, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.buffers[2])
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, triangles.nbytes, triangles, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+        self.n_indices = triangles.size
+        self.mesh_dirty = False
 
     def setSurface(self, surf):
         assert isinstance(surf, Surface)
         self.surf = surf
 
+        # uploaded on the next paint, where the context is current; the
+        # caller sets the surface again after changing its resolution
+        self.mesh_dirty = True
+
         rang = numpy.vstack([surf.xrange, surf.yrange])
         rang = rang[:,1] - rang[:,0]
         len_diag = numpy.max(rang)
@@ -120,6 +154,27 @@ class SurfaceRenderWidget(QGLWidget):
         self.xRot = 0
         self.yRot = 0
 
+
+class SurfaceRenderWidget(QGLWidget):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.renderer = SurfaceRenderer()
+        if parent is not None:
+            self.setGeometry(parent.geometry())
+            self.setSizePolicy(parent.sizePolicy())
+
+    def initializeGL(self):
+        self.renderer.initialize(self.width(), self.height())
+
+    def resizeGL(self, width, height):
+        self.renderer.resize(width, height)
+
+    def paintGL(self):
+        self.renderer.paint()
+
+    def setSurface(self, surf):
+        self.renderer.setSurface(surf)
         self.updateGL()
 
     def mousePressEvent(self, event):
@@ -130,8 +185,8 @@ class SurfaceRenderWidget(QGLWidget):
         dy = event.y() - self.lastPos.y()
 
         if event.buttons() & Qt.LeftButton:
-            self.xRot -= dx /3
-            self.yRot -= dy /3
+            self.renderer.xRot -= dx /3
+            self.renderer.yRot -= dy /3
             self.updateGL()
 
         self.lastPos = event.pos()
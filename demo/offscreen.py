@@ -0,0 +1,126 @@
+"""
+offscreen.py
+
+render the ground truth surface with `SurfaceRenderer` into an EGL pbuffer,
+without a display or window system, time rotating repaints and save the
+last frame
+
+    LIBGL_ALWAYS_SOFTWARE=1 python -m demo.offscreen -o surface.png
+
+Exits with 1 when nothing was drawn.
+"""
+import os
+
+# PyOpenGL binds its platform on the first import
+os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+
+import argparse
+import ctypes
+import sys
+import time
+
+import numpy
+from OpenGL import EGL
+from PyQt5.QtGui import QImage
+from OpenGL.GL import *
+
+from .formula import get_formula
+from .gl import SurfaceRenderer
+from .surface import TruthSurface
+
+
+# Mesa's display without any window system
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+
+def create_context(width, height):
+    """
+    make an OpenGL context on a width by height pbuffer current
+    """
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    for platform in (EGL_PLATFORM_SURFACELESS_MESA, None):
+        if platform is None:
+            display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        else:
+            display = EGL.eglGetPlatformDisplay(platform, EGL.EGL_DEFAULT_DISPLAY, None)
+        try:
+            if EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor)):
+                break
+        except EGL.EGLError:
+            pass
+    else:
+        raise RuntimeError('Cannot initialize EGL.')
+
+    attrs = (EGL.EGLint * 13)(
+        EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+        EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+        EGL.EGL_DEPTH_SIZE, 24,
+        EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+        EGL.EGL_NONE
+    )
+    config = EGL.EGLConfig()
+    n_config = EGL.EGLint()
+    EGL.eglChooseConfig(display, attrs, ctypes.pointer(config), 1, ctypes.pointer(n_config))
+    if n_config.value == 0:
+        raise RuntimeError('No EGL config renders OpenGL into a pbuffer.')
+
+    surface = EGL.eglCreatePbufferSurface(
+        display, config, (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+    if not EGL.eglMakeCurrent(display, surface, surface, context):
+        raise RuntimeError('Cannot make the EGL context current.')
+    return display
+
+
+def read_pixels(width, height) -> numpy.ndarray:
+    """
+    height by width by 3 uint8 frame, top row first
+    """
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    data = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+    return numpy.frombuffer(data, dtype=numpy.uint8).reshape(height, width, 3)[::-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m demo.offscreen')
+    parser.add_argument('-o', '--output', default='surface.png')
+    parser.add_argument('--samp', type=int, default=200, help='grid samples per axis')
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--size', type=int, nargs=2, default=(640, 480))
+    args = parser.parse_args(argv)
+
+    width, height = args.size
+    display = create_context(width, height)
+
+    renderer = SurfaceRenderer()
+    renderer.initialize(width, height)
+
+    # the defaults of the main window
+    formula = get_formula(formula_x_coef=.02, formula_x_power=2, formula_constant=120)
+    renderer.setSurface(TruthSurface(formula, (-50, 50), args.samp, (-50, 50), args.samp))
+    renderer.paint()
+    glFinish()
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        renderer.xRot -= 360 / args.frames
+        renderer.paint()
+        glFinish()
+    elapsed = time.perf_counter() - start
+
+    pixels = read_pixels(width, height)
+    EGL.eglTerminate(display)
+
+    image = QImage(pixels.tobytes(), width, height, 3 *width, QImage.Format_RGB888)
+    image.save(args.output)
+
+    drawn = numpy.mean(numpy.any(pixels != pixels[0, 0], axis=2))
+    print(
+        f'{args.samp}x{args.samp} grid: {args.frames / elapsed:.1f} frames/s,'
+        f' {drawn *100:.1f}% of the frame drawn -> {args.output}')
+    return 0 if drawn > 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
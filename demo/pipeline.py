@@ -0,0 +1,97 @@
+"""
+pipeline.py
+
+the synthetic shape-from-template pipeline, without any plotting:
+formula -> projection -> warp -> IsoPSfT
+"""
+import numpy
+
+from sft import TPS, IdentityEmbdding, IsoPSfT
+
+
+def sample_points(formula, xrang, yrang, xsamp, ysamp, nsamp, rng=None):
+    """
+    grid the surface of `formula` and pick `nsamp` of the points as control
+    points
+
+    ## Returns
+        + (xsamp*ysamp) by 3 matrix of points on the surface
+        + mask of the control points
+    """
+    if rng is None:
+        rng = numpy.random
+
+    xx, yy = numpy.meshgrid(
+        numpy.linspace(*xrang, xsamp),
+        numpy.linspace(*yrang, ysamp)
+    )
+    zz = formula.depth(xx, yy)
+
+    apoints_target = numpy.stack([xx, yy, zz], axis=2).reshape(-1, 3)
+
+    # sampling
+    sidx = rng.permutation(numpy.arange(xx.size))[:nsamp]
+
+    mask = numpy.zeros((xx.size), dtype=bool)
+    mask[sidx] = True
+
+    return apoints_target, mask
+
+
+def project(apoints_target, focal) -> numpy.ndarray:
+    """
+    pinhole projection of the surface points to image space
+    """
+    f = focal
+
+    apoints_image = numpy.dot(
+        numpy.array([
+            [f, 0, 0],
+            [0, f, 0],
+            [0, 0, 1]]
+        ),
+        apoints_target.T
+    )
+
+    apoints_image = apoints_image[:2] / apoints_image[2, None]
+    return apoints_image.T
+
+
+def normalize(apoints_image, focal) -> numpy.ndarray:
+    """
+    image points in normalized camera coordinates, K^-1 (u, v, 1) without
+    the homogeneous 1; shape from template expects these, not pixels
+    """
+    return apoints_image / focal
+
+
+def parameterize(formula, apoints_target):
+    """
+    position of the surface points on parameterization space
+
+    ## Returns
+        + n by 2 matrix of points on parameterization space
+        + their x range
+        + their y range
+    """
+    apoints_param = formula.param_position(*apoints_target.T)
+
+    xrang_param = numpy.min(apoints_param[:,0]), numpy.max(apoints_param[:,0])
+    yrang_param = numpy.min(apoints_param[:,1]), numpy.max(apoints_param[:,1])
+    return apoints_param, xrang_param, yrang_param
+
+
+def solve_warp(cpoints_param, cpoints_image) -> TPS:
+    """
+    thin plate spline warp from parameterization space to normalized image
+    coordinates, see `normalize`; raises `numpy.linalg.LinAlgError`
+    """
+    return TPS(cpoints_param, cpoints_image)
+
+
+def solve_sft(warp, cpoints_param) -> IsoPSfT:
+    """
+    shape from template on a planar template; raises
+    `numpy.linalg.LinAlgError`
+    """
+    return IsoPSfT(warp, IdentityEmbdding(), cpoints_param)
@@ -3,15 +3,36 @@ compute.py
 
 perform shape-from-template
 """
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
 import numpy
 
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.legend import Legend
+from sft import save_model, load_model
 
-from .surface import EstimatedSurface
+from .surface import EstimatedSurface, TruthSurface
 from .formula import get_formula
+from .pipeline import sample_points, project, normalize, parameterize, solve_warp, solve_sft
+
+
+# seed of the control point sampling unless one is given
+DEFAULT_SEED = 0
+
+# solves kept in memory
+RESULT_CACHE_SIZE = 8
+
+# part of every cache key; bump when the results of a solve change
+CACHE_VERSION = 2
 
-from sft import TPS, IdentityEmbdding, IsoPSfT
+# point sets of a result, as stored on disk
+RESULT_ARRAYS = (
+    'apoints_target', 'mask', 'apoints_image', 'apoints_warped', 'apoints_estimated'
+)
 
 
 CONFIG_CONTROL_POINTS = {
@@ -30,28 +51,234 @@ CONFIG_ESTIMATED = {
 }
 
 
-def solve(**kwarg):
-    fig = kwarg['fig']
-    fig.clear()
+class Cancelled(Exception):
+    """
+    raised by a `progress` callback to stop `compute` between its stages
+    """
 
-    def error_text(pos, msg):
-        ax = fig.add_subplot(2, 2, pos)
-        ax.text(.5, .5, msg, color='red', verticalalignment='center', horizontalalignment='center')
+
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+
+def cache_key(formula, xrang, yrang, xsamp, ysamp, nsamp, focal, seed) -> str:
+    """
+    digest of every input of a solve
+    """
+    params = {
+        'version': CACHE_VERSION,
+        'formula': formula.params(),
+        'xrang': [float(v) for v in xrang],
+        'yrang': [float(v) for v in yrang],
+        'samp': [int(xsamp), int(ysamp), int(nsamp)],
+        'focal': float(focal),
+        'seed': seed,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def compute(
+        formula, xrang, yrang, xsamp, ysamp, nsamp, focal,
+        progress=None, seed=DEFAULT_SEED, cache_dir=None) -> dict:
+    """
+    Run the pipeline without plotting; safe to call off the GUI thread.
+
+    The control points are drawn with `seed`, so equal inputs give equal
+    results; the last `RESULT_CACHE_SIZE` of them are kept in memory and,
+    with `cache_dir`, every one on disk as well.
+
+    ## Arguments
+        + `progress`  - called with a message before every stage; raise
+                        `Cancelled` from it to stop
+        + `seed`      - seed of the control point sampling; `None` draws
+                        new ones every time and skips the caches
+        + `cache_dir` - directory of the disk cache, created on demand
+
+    ## Returns
+        dict with the point sets of every stage that was reached, `error`, a
+        message when the warp or sft failed, `warp`, `model` and `surface`,
+        the `EstimatedSurface`, on success, and `key`, the `cache_key`. The
+        models are shared with the other results of the same inputs, every
+        result has a surface of its own.
+    """
+    if progress is None:
+        progress = lambda message: None
+
+    if seed is None:
+        result = _compute(formula, xrang, yrang, xsamp, ysamp, nsamp, focal, None, progress)
+        return dict(result, key=None)
+
+    key = cache_key(formula, xrang, yrang, xsamp, ysamp, nsamp, focal, seed)
+    with _results_lock:
+        result = _results.get(key)
+        if result is not None:
+            _results.move_to_end(key)
+
+    if result is None and cache_dir is not None:
+        progress('loading the cached solve')
+        result = _load_result(os.path.join(cache_dir, key))
+
+    if result is None:
+        result = _compute(
+            formula, xrang, yrang, xsamp, ysamp, nsamp, focal,
+            numpy.random.RandomState(seed), progress)
+        if cache_dir is not None:
+            _save_result(cache_dir, key, result)
+
+    with _results_lock:
+        _results[key] = result
+        while len(_results) > RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+
+    # callers may add to their copy and resample their surface
+    result = dict(result, key=key)
+    if result['surface'] is not None:
+        result['surface'] = result['surface'].copy()
+    return result
+
+
+def _save_result(cache_dir, key, result):
+    """
+    *assistant func* write a result under `cache_dir/key`, atomically
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = tempfile.mkdtemp(prefix='.', dir=cache_dir)
+    try:
+        arrays = {name: result[name] for name in RESULT_ARRAYS if name in result}
+        numpy.savez(
+            os.path.join(path, 'result.npz'),
+            error=numpy.array(result['error'] or ''),
+            param_range=numpy.array(result['param_range']),
+            **arrays
+        )
+        for name in ('warp', 'model'):
+            if result.get(name) is not None:
+                save_model(result[name], os.path.join(path, f'{name}.sft'))
+        os.rename(path, os.path.join(cache_dir, key))
+    except OSError:
+        # another process stored the same inputs first
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _load_result(path):
+    """
+    *assistant func* result stored by `_save_result`; `None` when there is
+    none
+    """
+    if not os.path.isdir(path):
+        return None
+
+    with numpy.load(os.path.join(path, 'result.npz')) as data:
+        result = {name: data[name] for name in data.files}
+    result['error'] = str(result['error']) or None
+    result['param_range'] = tuple(map(tuple, result['param_range']))
+
+    # the cache holds native models only; a pickled one in there was not
+    # written by `_save_result` and must not run
+    for name in ('warp', 'model'):
+        model_path = os.path.join(path, f'{name}.sft')
+        result[name] = None
+        if os.path.exists(model_path):
+            result[name] = load_model(model_path, allow_pickle=False)
+
+    result['surface'] = None
+    if result['model'] is not None:
+        result['surface'] = EstimatedSurface(result['model'], *result['param_range'])
+    return result
+
+
+def _compute(formula, xrang, yrang, xsamp, ysamp, nsamp, focal, rng, progress) -> dict:
+    """
+    *assistant func* the pipeline behind `compute`
+    """
+    result = {'error': None, 'warp': None, 'model': None, 'surface': None}
 
     # get all points
-    xx, yy = numpy.meshgrid(
-        numpy.linspace(*kwarg['xrang'], kwarg['xsamp']),
-        numpy.linspace(*kwarg['yrang'], kwarg['ysamp'])
-    )
-    zz = kwarg['formula'].depth(xx, yy)
+    progress('sampling points')
+    apoints_target, mask = sample_points(formula, xrang, yrang, xsamp, ysamp, nsamp, rng)
+    result.update(apoints_target=apoints_target, mask=mask)
+
+    # project to image space
+    progress('projecting')
+    apoints_image = project(apoints_target, focal)
+    result['apoints_image'] = apoints_image
+
+    # project to parameterization space & solve
+    progress('parameterizing')
+    apoints_param, xrang_param, yrang_param = parameterize(formula, apoints_target)
+    cpoints_param = apoints_param[mask]
+    result['param_range'] = xrang_param, yrang_param
+
+    # solve tps warp, on normalized camera coordinates
+    progress('solving thin plate spline')
+    cpoints_normalized = normalize(apoints_image[mask], focal)
+    try:
+        warp = solve_warp(cpoints_param, cpoints_normalized)
+    except numpy.linalg.LinAlgError:
+        result['error'] = 'Can\'t solve thin plate spline'
+        return result
+    result['warp'] = warp
+    # in pixels, like the image points
+    result['apoints_warped'] = warp(apoints_param) *focal
+
+    # solve sft
+    progress('solving shape from template')
+    try:
+        solution = solve_sft(warp, cpoints_param)
+    except numpy.linalg.LinAlgError:
+        result['error'] = 'Can\'t solve shape from template'
+        return result
+    result['model'] = solution
+    result['apoints_estimated'] = solution(apoints_param)
+
+    progress('building the estimated surface')
+    result['surface'] = EstimatedSurface(solution, xrang_param, yrang_param)
+    return result
 
-    apoints_target = numpy.stack([xx, yy, zz], axis=2).reshape(-1, 3)
 
-    # sampling
-    sidx = numpy.random.permutation(numpy.arange(xx.size))[:kwarg['nsamp']]
+def generate(
+        formula, xrang, yrang, xsamp, ysamp, nsamp, focal, vsamp,
+        progress=None, seed=DEFAULT_SEED, cache_dir=None) -> dict:
+    """
+    `compute` together with the ground truth surface, both sampled at
+    `vsamp` for rendering; the whole work of a solve in the demo
+
+    ## Returns
+        the `compute` result with the `TruthSurface` as `gtruth`
+    """
+    if progress is None:
+        progress = lambda message: None
+
+    progress('building the ground truth surface')
+    gtruth = TruthSurface(formula, xrang, vsamp[0], yrang, vsamp[1])
+
+    result = compute(
+        formula, xrang, yrang, xsamp, ysamp, nsamp, focal, progress, seed, cache_dir)
+    result['gtruth'] = gtruth
+
+    if result['surface'] is not None:
+        progress('sampling the estimated surface')
+        result['surface'].setNumSamp(*vsamp)
+    return result
+
+
+def plot(fig, result):
+    """
+    draw the stages of a `compute` result on `fig`
+    """
+    # registers the `3d` projection; imported here so that the computational
+    # modules stay free of matplotlib
+    from mpl_toolkits.mplot3d import Axes3D
+
+    fig.clear()
+
+    def error_text(pos, msg):
+        ax = fig.add_subplot(2, 2, pos)
+        ax.text(.5, .5, msg, color='red', verticalalignment='center', horizontalalignment='center')
 
-    mask = numpy.zeros((xx.size), dtype=bool)
-    mask[sidx] = True
+    apoints_target = result['apoints_target']
+    apoints_image = result['apoints_image']
+    mask = result['mask']
 
     ax = fig.add_subplot(2, 2, 1, projection='3d')
     ax.set_title('ground truth point set')
@@ -61,57 +288,43 @@ def solve(**kwarg):
     ax.set_ylabel('y')
     ax.set_zlabel('z')
 
-    # project to image space
-    f = kwarg['focal']
-
-    apoints_image = numpy.dot(
-        numpy.array([
-            [f, 0, 0],
-            [0, f, 0],
-            [0, 0, 1]]
-        ),
-        apoints_target.T
-    )
-
-    apoints_image = apoints_image[:2] / apoints_image[2, None]
-    apoints_image = apoints_image.T
-
     ax = fig.add_subplot(2, 2, 3)
     ax.set_title('point set on image')
     ax.grid()
     ax.scatter(*apoints_image[mask].T, **CONFIG_CONTROL_POINTS)
     ax.scatter(*apoints_image[~mask].T, **CONFIG_OTHER_POINTS)
 
-    # project to parameterization space & solve
-    apoints_param = kwarg['formula'].param_position(*apoints_target.T)
-
-    xrang_param = numpy.min(apoints_param[:,0]), numpy.max(apoints_param[:,0])
-    yrang_param = numpy.min(apoints_param[:,1]), numpy.max(apoints_param[:,1])
-    cpoints_param = apoints_param[mask]
-
-    # solve tps warp
-    try:
-        warp = TPS(cpoints_param, apoints_image[mask])
-    except numpy.linalg.LinAlgError:
-        error_text(4, 'Can\'t solve thin plate spline')
+    if 'apoints_warped' not in result:
+        error_text(4, result['error'])
         return
 
     ax = fig.add_subplot(2, 2, 4)
     ax.set_title('estimated warp')
-    ax.scatter(*warp(apoints_param).T, **CONFIG_ESTIMATED)
+    ax.scatter(*result['apoints_warped'].T, **CONFIG_ESTIMATED)
 
-    # solve sft
-    try:
-        solution = IsoPSfT(warp, IdentityEmbdding(), cpoints_param)
-    except numpy.linalg.LinAlgError:
-        error_text(2, 'Can\'t solve shape from template')
+    if 'apoints_estimated' not in result:
+        error_text(2, result['error'])
         return
 
     ax = fig.add_subplot(2, 2, 2, projection='3d')
     ax.set_title('estimated surface')
-    ax.scatter3D(*solution(apoints_param).T, **CONFIG_ESTIMATED)
+    ax.scatter3D(*result['apoints_estimated'].T, **CONFIG_ESTIMATED)
     ax.set_xlabel('x')
     ax.set_ylabel('y')
     ax.set_zlabel('z')
 
-    return EstimatedSurface(solution, xrang_param, yrang_param)
+
+def solve(**kwarg):
+    result = compute(
+        kwarg['formula'],
+        kwarg['xrang'],
+        kwarg['yrang'],
+        kwarg['xsamp'],
+        kwarg['ysamp'],
+        kwarg['nsamp'],
+        kwarg['focal'],
+        seed=kwarg.get('seed', DEFAULT_SEED),
+        cache_dir=kwarg.get('cache_dir')
+    )
+    plot(kwarg['fig'], result)
+    return result['surface']
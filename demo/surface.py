@@ -3,22 +3,67 @@ surface.py
 
 customized surface descriptor object to render
 """
+import copy
 from abc import ABC, abstractclassmethod
+from collections import OrderedDict
 
 import numpy
 
 from .formula import get_formula
 
 
+# sampled resolutions kept per surface
+MESH_CACHE_SIZE = 8
+
+
 class Surface(ABC):
 
     def __init__(self, xrang, xsamp, yrang, ysamp):
         self.xrange = numpy.array(xrang)
         self.yrange = numpy.array(yrang)
+
+        # (xsamp, ysamp) -> sampled grid, least recently used first
+        self._samples = OrderedDict()
         self.setNumSamp(xsamp, ysamp)
 
     def setNumSamp(self, xsamp, ysamp):
-        self.shape = ysamp, xsamp
+        """
+        sample the surface on an xsamp by ysamp grid; the last
+        `MESH_CACHE_SIZE` resolutions are kept, so returning to one of them
+        evaluates nothing
+        """
+        key = xsamp, ysamp
+        if key in self._samples:
+            self._samples.move_to_end(key)
+        else:
+            self._samples[key] = self._sample(xsamp, ysamp)
+            while len(self._samples) > MESH_CACHE_SIZE:
+                self._samples.popitem(last=False)
+
+        self._current = sample = self._samples[key]
+        self.shape = sample['shape']
+        self.zrange = sample['zrange']
+        self.center = sample['center']
+        self._points = sample['points']
+        self._normal = sample['normal']
+
+    def copy(self) -> 'Surface':
+        """
+        a surface with a resolution of its own; the sampled grids so far are
+        shared, they are never modified
+        """
+        other = copy.copy(self)
+        other._samples = OrderedDict(
+            (key, dict(sample)) for key, sample in self._samples.items())
+        other._current = other._samples[self.shape[::-1]]
+        return other
+
+    def _sample(self, xsamp, ysamp) -> dict:
+        """
+        *assistant func* points and normals of the surface on an xsamp by
+        ysamp grid
+        """
+        shape = ysamp, xsamp
         xx, yy = numpy.meshgrid(
             numpy.linspace(*self.xrange, xsamp),
             numpy.linspace(*self.yrange, ysamp)
@@ -27,29 +72,86 @@ class Surface(ABC):
         # estimate z
         zz = self.depth(xx, yy)
 
-        self._points = numpy.stack([xx, yy, zz], axis=2)
-        self.zrange = numpy.array([
+        points = numpy.stack([xx, yy, zz], axis=2)
+        zrange = numpy.array([
                 numpy.min(zz), numpy.max(zz)
             ])
-        self.center = numpy.average(numpy.vstack([
-                self.xrange, self.yrange, self.zrange
+        center = numpy.average(numpy.vstack([
+                self.xrange, self.yrange, zrange
             ]), axis=1)
 
         # estimate normal
-        self._normal = numpy.empty(self._points.shape)
-        for i, row in enumerate(self._points):
-            for j, point in enumerate(row):
-                self._normal[i, j] = self.normal(*point)
-
-        self._points -= self.center[None, None, :]
+        normal = self.normals(xx, yy, zz)
+
+        points -= center[None, None, :]
+        return {
+            'shape': shape,
+            'zrange': zrange,
+            'center': center,
+            'points': points,
+            'normal': normal,
+            'mesh': None
+        }
 
     @abstractclassmethod
     def depth(self, xx, yy) -> numpy.ndarray:
         ...
 
-    @abstractclassmethod
+    def gradient(self, xx, yy, zz) -> (numpy.ndarray, numpy.ndarray):
+        """
+        partial derivatives of the depth on the grid; forward differences
+        unless the surface knows them in closed form
+        """
+        return self.depth(xx +1, yy) -zz, self.depth(xx, yy +1) -zz
+
+    def normals(self, xx, yy, zz) -> numpy.ndarray:
+        """
+        normal of every grid point, (dz/dx, dz/dy, -1) as the cross product
+        of the tangents (0, 1, dz/dy) and (1, 0, dz/dx)
+        """
+        dzdx, dzdy = self.gradient(xx, yy, zz)
+        return numpy.stack([dzdx, dzdy, -numpy.ones(zz.shape)], axis=-1)
+
     def normal(self, x, y, z) -> numpy.ndarray:
-        ...
+        return self.normals(*(numpy.array([[v]], dtype=float) for v in (x, y, z)))[0, 0]
+
+    def mesh(self):
+        """
+        The grid as triangles.
+
+        ## Returns
+            + (rows*cols) by 3 float32 vertices, centered
+            + (rows*cols) by 3 float32 normals
+            + (2*(rows-1)*(cols-1)) by 3 uint32 vertex indices, every quad
+              split along its (i, j) - (i+1, j+1) diagonal
+
+        built once per cached resolution
+        """
+        if self._current['mesh'] is None:
+            self._current['mesh'] = self._mesh()
+        return self._current['mesh']
+
+    def _mesh(self):
+        """
+        *assistant func* see `mesh`
+        """
+        rows, cols = self.shape
+        index = numpy.arange(rows *cols, dtype=numpy.uint32).reshape(rows, cols)
+
+        a = index[:-1, :-1]
+        b = index[1:, :-1]
+        c = index[1:, 1:]
+        d = index[:-1, 1:]
+        triangles = numpy.stack([
+            numpy.stack([a, b, c], axis=-1),
+            numpy.stack([a, c, d], axis=-1)
+        ], axis=2).reshape(-1, 3)
+
+        return (
+            self._points.reshape(-1, 3).astype(numpy.float32),
+            self._normal.reshape(-1, 3).astype(numpy.float32),
+            triangles
+        )
 
     def __getitem__(self, index) -> (numpy.ndarray, numpy.ndarray):
         point = self._points[index]
@@ -66,10 +168,8 @@ class TruthSurface(Surface):
     def depth(self, xx, yy):
         return self.formula.depth(xx, yy)
 
-    def normal(self, x, y, z):
-        vecX = numpy.array([1, 0, self.formula.depth(x+1, y) -z])
-        vecY = numpy.array([0, 1, self.formula.depth(x, y+1) -z])
-        return numpy.cross(vecY, vecX)
+    def gradient(self, xx, yy, zz):
+        return self.formula.gradient(xx, yy)
 
 
 class EstimatedSurface(Surface):
@@ -83,7 +183,11 @@ class EstimatedSurface(Surface):
         y = yy.reshape(-1, 1)
         return self.solution(numpy.hstack([x, y]))[:,2].reshape(xx.shape)
 
-    def normal(self, x, y, z):
-        vecX = numpy.array([1, 0, self.depth(x+1, y) -z])
-        vecY = numpy.array([0, 1, self.depth(x, y+1) -z])
-        return numpy.cross(vecY, vecX)
+    def gradient(self, xx, yy, zz):
+        points = numpy.stack([xx.reshape(-1), yy.reshape(-1)], axis=1)
+        try:
+            # n by 3 by 2; the depth is the third output
+            jacobian = self.solution.jacobian(points)
+        except NotImplementedError:
+            return super().gradient(xx, yy, zz)
+        return jacobian[:, 2, 0].reshape(xx.shape), jacobian[:, 2, 1].reshape(xx.shape)
@@ -0,0 +1,108 @@
+"""
+worker.py
+
+run solves off the GUI thread
+"""
+import threading
+
+from PyQt5 import QtCore
+
+from .solution import Cancelled
+
+
+class _TaskSignals(QtCore.QObject):
+    """
+    *assistant class* signals of the tasks, tagged with their generation;
+    lives on the GUI thread so that emitting from a worker is queued
+    """
+    progress = QtCore.pyqtSignal(int, str)
+    finished = QtCore.pyqtSignal(int, object)
+    failed = QtCore.pyqtSignal(int, str)
+
+
+class _Task(QtCore.QRunnable):
+    """
+    *assistant class* one call of `func` on the thread pool
+    """
+
+    def __init__(self, generation, signals, func, kwarg):
+        super().__init__()
+        self.generation = generation
+        self.signals = signals
+        self.func = func
+        self.kwarg = kwarg
+        self.cancelled = threading.Event()
+
+    def progress(self, message):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        self.signals.progress.emit(self.generation, message)
+
+    def run(self):
+        try:
+            result = self.func(progress=self.progress, **self.kwarg)
+        except Cancelled:
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.generation, f'{type(e).__name__}: {e}')
+            return
+        self.signals.finished.emit(self.generation, result)
+
+
+class BackgroundSolver(QtCore.QObject):
+    """
+    Runs a function on a worker thread, one at a time: starting another
+    cancels the one in flight. `func` takes a `progress(message)` keyword
+    and calls it between its stages, where a cancelled run stops by
+    `Cancelled`; whatever a superseded run still reports is dropped.
+
+    The signals are delivered on the thread of the solver, the GUI thread.
+    """
+    progress = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.generation = 0
+        self.task = None
+
+        self.signals = _TaskSignals(self)
+        self.signals.progress.connect(self._on_progress)
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+
+    def start(self, func, **kwarg):
+        self.cancel()
+        self.generation += 1
+        self.task = _Task(self.generation, self.signals, func, kwarg)
+        self.pool.start(self.task)
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancelled.set()
+            self.task = None
+
+    def busy(self) -> bool:
+        return self.task is not None
+
+    def wait(self, msecs=-1) -> bool:
+        """
+        block until every run, cancelled ones included, has returned
+        """
+        return self.pool.waitForDone(msecs)
+
+    def _on_progress(self, generation, message):
+        if generation == self.generation and self.task is not None:
+            self.progress.emit(message)
+
+    def _on_finished(self, generation, result):
+        if generation == self.generation and self.task is not None:
+            self.task = None
+            self.finished.emit(result)
+
+    def _on_failed(self, generation, message):
+        if generation == self.generation and self.task is not None:
+            self.task = None
+            self.failed.emit(message)
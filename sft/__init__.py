@@ -1,2 +1,6 @@
 from .embedding import *
 from .isop import IsoPSfT
+from .sequence import IsoPSfTSequence
+from .stats import Stats
+from .storage import save_model, load_model
+from .service import ModelPool
@@ -1,5 +1,7 @@
 from .base import Embdding
 
 from .identity import IdentityEmbdding
-from .tps import TPS
+from .plan import EvaluationPlan
+from .tps import TPS, BatchedTPS, farthest_point_centers
+from .tps_approx import ApproxTPS
 from .tps_warp import TpsWarp
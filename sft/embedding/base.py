@@ -8,3 +8,20 @@ class Embdding(ABC):
     @abstractmethod
     def __call__(self, pt) -> numpy.ndarray:
         ...
+
+    def jacobian(self, points) -> numpy.ndarray:
+        """
+        Optional closed-form derivative of this embedding.
+
+        ## Arguments
+            + `points` - n by d matrix of input points
+
+        ## Returns
+            n by m by d array where `[i, j, k]` is the derivative of output
+            component j with respect to input component k at point i.
+
+        ## Raises
+            `NotImplementedError` when the embedding has no closed form; the
+            callers then fall back to finite differences.
+        """
+        raise NotImplementedError()
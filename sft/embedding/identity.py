@@ -21,3 +21,18 @@ class IdentityEmbdding(Embdding):
             # otherwise
             assert len(points) == 2
             return numpy.array((*points, 1), dtype=float).reshape(-1)
+
+    def jacobian(self, points) -> numpy.ndarray:
+        points = numpy.array(points, dtype=float)
+        deriv = numpy.array([
+            [1, 0],
+            [0, 1],
+            [0, 0]
+        ], dtype=float)
+
+        if len(points.shape) == 2:
+            assert points.shape[1] == 2
+            return numpy.tile(deriv, (points.shape[0], 1, 1))
+
+        assert len(points) == 2
+        return deriv
@@ -0,0 +1,87 @@
+"""
+plan.py
+
+precomputed evaluation of thin plate splines on a fixed set of points
+"""
+from .tps import _2darray, pairwise_radial_basis
+
+import numpy
+
+
+class EvaluationPlan:
+    """
+    The `[A V]` basis of a fixed set of query points against a fixed set of
+    spline source points. Evaluating any spline fitted on those source points
+    is then a single matrix product.
+
+    The plan does not follow its splines: it checks that the source points of
+    every spline applied to it match the compiled ones and raises otherwise.
+    Call `compile` to rebuild it for new source points and `invalidate` to
+    release the basis.
+    """
+
+    def __init__(self, points, source_points=None):
+        """
+        ## Arguments
+            + `points`        - n by d matrix of query points
+            + `source_points` - p by d matrix of spline source points; the
+                                plan is compiled right away when given
+        """
+        self.points = _2darray(points)
+        self.source_points = None
+        self.basis = None
+
+        if source_points is not None:
+            self.compile(source_points)
+
+    def compile(self, source_points) -> 'EvaluationPlan':
+        """
+        Build the basis for `source_points`.
+        """
+        source_points = _2darray(source_points)
+        assert source_points.shape[1] == self.points.shape[1], \
+            f'Dimension of `source_points` (d={source_points.shape[1]})' \
+            f' not match with the query points (d={self.points.shape[1]}).'
+
+        n = self.points.shape[0]
+        self.basis = numpy.hstack([
+            pairwise_radial_basis(self.points, source_points),
+            numpy.ones((n, 1)),
+            self.points
+        ])
+        self.source_points = source_points
+        return self
+
+    def invalidate(self):
+        """
+        Drop the basis; the plan has to be compiled again before use.
+        """
+        self.basis = None
+        self.source_points = None
+
+    def matches(self, source_points) -> bool:
+        """
+        Whether the plan is compiled for `source_points`.
+        """
+        if self.source_points is None:
+            return False
+        if source_points is self.source_points:
+            return True
+        return source_points.shape == self.source_points.shape \
+            and numpy.array_equal(source_points, self.source_points)
+
+    def __call__(self, model, out=None) -> numpy.ndarray:
+        """
+        Evaluate a fitted spline on the planned points.
+
+        ## Arguments
+            + `model` - a `TPS`, or any object whose `tps` attribute is one
+                        such as `IsoPSfT` and `TpsWarp`
+            + `out`   - optional n by d array the result is written into
+        """
+        tps = getattr(model, 'tps', model)
+        if not self.matches(tps.source_points):
+            raise ValueError(
+                'The evaluation plan is not compiled for the source points of'
+                ' this spline.')
+        return numpy.dot(self.basis, tps.coef, out=out)
@@ -36,8 +36,36 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 from .base import Embdding
 
+import copy
+import warnings
+
 import numpy
-from scipy.spatial.distance import cdist
+
+from ..stats import stage
+
+# candidates of the `'gcv'` and `'loo'` selection of `alpha`
+ALPHA_CRITERIA = ('gcv', 'loo')
+ALPHA_CANDIDATES = 50
+
+# `max_residual` adds centers up to this fraction of the control points;
+# beyond it the reduced fit costs as much as the exact one
+MAX_CENTER_FRACTION = .5
+
+# scipy and concurrent.futures are imported where they are used: they make
+# up most of the import time of `sft` and many processes never fit or
+# evaluate a spline.
+
+
+# bytes held per query/source pair while evaluating: distance, log and mask
+BYTES_PER_BASIS = 8 + 8 + 1
+
+# default block budget of `TPS.__call__`; small enough for the cache and to
+# leave many more blocks than workers. The blocks never depend on the
+# number of workers, so serial and parallel results are identical
+EVAL_BLOCK_BYTES = 1 << 21
+
+# default block budget of `BatchedTPS.__call__`
+BATCH_BLOCK_BYTES = 1 << 21
 
 
 def _2darray(data) -> numpy.ndarray:
@@ -50,7 +78,7 @@ def _2darray(data) -> numpy.ndarray:
     return data
 
 
-def pairwise_radial_basis(A, B):
+def pairwise_radial_basis(A, B, out=None):
     """
     Compute the TPS radial basis function phi(r) between every row-pair of A
     and B where r is the Euclidean distance.
@@ -61,56 +89,243 @@ def pairwise_radial_basis(A, B):
         ```
 
     ## Arguments
-        + `A` - n by d vector containing n d-dimensional points.
-        + `B` - m by d vector containing m d-dimensional points.
+        + `A`   - n by d vector containing n d-dimensional points.
+        + `B`   - m by d vector containing m d-dimensional points.
+        + `out` - optional n by m float array to write the result into.
 
     ## Returns
         ```math
         P - P(i, j) = phi(norm(A(i,:)-B(j,:)))
-                where phi(r) = r^2*log(r) for r >= 1
-                               r*log(r^r) for r <  1
+                where phi(r) = r^2*log(r) for r > 0
+                               0          for r = 0
         ```
 
     ## References
         1. https://en.wikipedia.org/wiki/Polyharmonic_spline
         2. https://en.wikipedia.org/wiki/Radial_basis_function
     """
+    from scipy.spatial.distance import cdist
+
     # r_mat(i, j) is the Euclidean distance between A(i, :) and B(j, :).
-    r_mat = cdist(A, B)
+    r_mat = cdist(A, B, out=out)
 
-    pwise_cond_ind1 = r_mat >= 1
-    pwise_cond_ind2 = r_mat < 1
-    r_mat_p1 = r_mat[pwise_cond_ind1]
-    r_mat_p2 = r_mat[pwise_cond_ind2]
+    # P correcponds to the matrix A from [1]; computed in place so only one
+    # extra n by m buffer is held at a time.
+    log_r = numpy.zeros(r_mat.shape)
+    numpy.log(r_mat, out=log_r, where=r_mat > 0)
 
-    # P correcponds to the matrix A from [1].
-    P = numpy.empty(r_mat.shape)
-    P[pwise_cond_ind1] = (r_mat_p1 **2) *numpy.log(r_mat_p1)
-    P[pwise_cond_ind2] = r_mat_p2 *numpy.log(numpy.power(r_mat_p2, r_mat_p2))
+    P = r_mat
+    P *= P
+    P *= log_r
 
     return P
 
 
+def _block_rows(n, p, block_size=None, max_bytes=None):
+    """
+    *assistant func* number of query points evaluated at once so that the n
+    by p intermediates stay within `block_size` rows and `max_bytes` bytes
+    """
+    rows = max(n, 1)
+    if block_size is not None:
+        rows = min(rows, int(block_size))
+    if max_bytes is not None:
+        rows = min(rows, int(max_bytes) // (BYTES_PER_BASIS *max(p, 1)))
+    return max(rows, 1)
+
+
+# the model of a process pool worker, see `_set_worker_tps`
+_worker_tps = None
+
+
+def _set_worker_tps(tps):
+    """
+    *assistant func* process pool initializer; the model is sent once per
+    worker instead of once per block
+    """
+    global _worker_tps
+    _worker_tps = tps
+
+
+def _evaluate_worker_block(points) -> numpy.ndarray:
+    """
+    *assistant func* block evaluation on the model of `_set_worker_tps`
+    """
+    return _worker_tps._evaluate(points, numpy.empty((points.shape[0], _worker_tps.coef.shape[1])))
+
+
+def _evaluate_block_list(tps, blocks) -> list:
+    """
+    *assistant func* evaluation of several blocks in one task, so that a
+    caller's executor receives the model once per task
+    """
+    return [
+        tps._evaluate(points, numpy.empty((points.shape[0], tps.coef.shape[1])))
+        for points in blocks
+    ]
+
+
+def pairwise_radial_basis_derivative(A, B):
+    """
+    Compute the factor of the TPS radial basis gradient between every row-pair
+    of A and B.
+
+    ## Usage
+        ```python
+        D = pairwise_radial_basis_derivative(A, B)
+        ```
+
+    ## Arguments
+        + `A` - n by d vector containing n d-dimensional points.
+        + `B` - m by d vector containing m d-dimensional points.
+
+    ## Returns
+        ```math
+        D - D(i, j) = 2*log(r) + 1
+                where r = norm(A(i,:)-B(j,:)), and D(i, j) = 0 for r = 0
+        ```
+
+        so that the gradient of phi(norm(x-B(j,:))) at x = A(i,:) is
+        D(i, j) * (A(i,:)-B(j,:)).
+    """
+    from scipy.spatial.distance import cdist
+
+    r_mat = cdist(A, B)
+
+    nonzero = r_mat > 0
+
+    D = numpy.zeros(r_mat.shape)
+    D[nonzero] = 2 *numpy.log(r_mat[nonzero]) +1
+
+    return D
+
+
+def farthest_point_centers(points, n) -> numpy.ndarray:
+    """
+    Pick `n` rows of `points` that cover them evenly, by farthest point
+    sampling starting from the point closest to the centroid.
+
+    ## Arguments
+        + `points` - p by d vector of points.
+        + `n`      - number of centers, at most p.
+
+    ## Returns
+        indices of the chosen rows.
+    """
+    p = points.shape[0]
+    n = min(int(n), p)
+
+    chosen = numpy.empty(n, dtype=int)
+    chosen[0] = numpy.argmin(numpy.sum((points - numpy.mean(points, axis=0)) **2, axis=1))
+
+    dist = numpy.sum((points - points[chosen[0]]) **2, axis=1)
+    for i in range(1, n):
+        chosen[i] = numpy.argmax(dist)
+        dist = numpy.minimum(dist, numpy.sum((points - points[chosen[i]]) **2, axis=1))
+
+    return chosen
+
+
+def _factorize(M, stats=None):
+    """
+    *assistant func* LU factorization of the system matrix; raises
+    `numpy.linalg.LinAlgError` on a singular matrix like `numpy.linalg.solve`
+    """
+    from scipy.linalg import LinAlgWarning, lu_factor
+    from scipy.linalg.lapack import dgecon
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', LinAlgWarning)
+        lu, piv = lu_factor(M, check_finite=False)
+    if numpy.any(numpy.diag(lu) == 0):
+        raise numpy.linalg.LinAlgError('Singular matrix')
+
+    if stats is not None:
+        # 1-norm condition estimate from the factors, O(n^2)
+        rcond, _ = dgecon(lu, numpy.linalg.norm(M, 1), norm='1')
+        stats.record('tps_size', M.shape[0])
+        stats.record('tps_condition', 1 / rcond if rcond > 0 else numpy.inf)
+
+    return lu, piv
+
+
+def _row_keys(points) -> numpy.ndarray:
+    """
+    *assistant func* one comparable scalar per row of `points`
+    """
+    points = numpy.ascontiguousarray(points)
+    return points.view(numpy.dtype((numpy.void, points.dtype.itemsize *points.shape[1]))).ravel()
+
+
+def _affine_dims(source_points) -> numpy.ndarray:
+    """
+    *assistant func* coordinates that vary over the control points; the
+    affine terms of the others cannot be determined
+    """
+    if len(source_points) == 0:
+        # nothing to fit; keep every term so that the system stays singular
+        return numpy.arange(source_points.shape[1])
+    return numpy.flatnonzero(numpy.ptp(source_points, axis=0) > 0)
+
+
 class TPS(Embdding):
     """
     The thin plate spline warpping
     """
 
+    stats = None
+    alpha_scores = None
+
     def __init__(
         self,
         source_points   :numpy.ndarray,
         target_points   :numpy.ndarray,
-        alpha           :float = 0
+        alpha           :float = 0,
+        centers         = None,
+        max_residual    :float = None,
+        stats           = None,
+        alphas          = None
     ):
         """
         Given a set of control points and their displacements, compute the
         coefficients of the TPS interpolant f(S) deforming surface S.
 
         ## Arguments
-            + `source_points` - p by d vector of control points.
+            + `source_points` - p by d vector of control points. A coordinate
+                                constant over all of them (e.g. z = 1 of a
+                                planar template) has no affine term; it is
+                                fixed to 0, which leaves the spline unchanged
+                                on that plane.
             + `target_points` - p by d vector of corresponding control points
                                 in the mapping function f(S).
             + `alpha`         - regularization parameter. See page 4 of [3].
+                                `'gcv'` or `'loo'` picks it from `alphas`
+                                by generalized cross-validation or by the
+                                leave-one-out error, see `_fit_select`.
+            + `centers`       - fit an approximate spline on fewer radial
+                                basis centers instead of every control point;
+                                either the number of centers, picked by
+                                `farthest_point_centers`, or a c by d vector
+                                of center positions. Costs O(p*c^2) instead
+                                of O(p^3).
+            + `max_residual`  - with `centers`, keep adding the worst fitted
+                                control points as centers until the largest
+                                residual is below this value, or warn when
+                                `MAX_CENTER_FRACTION` of the control points
+                                do not reach it.
+            + `stats`         - optional `sft.Stats` collecting the `tps_fit`
+                                and `evaluate` timings and the size and
+                                condition estimate of the system.
+            + `alphas`        - candidates of `'gcv'` and `'loo'`; defaults
+                                to `ALPHA_CANDIDATES` log-spaced values scaled
+                                to the kernel matrix.
+
+        After fitting, `residual` holds the largest absolute difference
+        between f(source_points) and target_points. With a selected `alpha`,
+        `alpha` holds the chosen value and `alpha_scores` the candidates and
+        their scores. The factorization of the
+        system is kept, so `refit` and `with_targets` only cost O(p^2) for
+        new targets on the same control points.
 
         ## References
             1. http://en.wikipedia.org/wiki/Polyharmonic_spline
@@ -124,8 +339,173 @@ class TPS(Embdding):
             f'Size of `source_points` {source_points.shape} does not equal' \
             f' to `target_points` {target_points.shape}.'
 
+        self.d = source_points.shape[1]
+        self.alpha = alpha
+        self.control_points = source_points
+        self.stats = stats
+
+        with stage(stats, 'tps_fit'):
+            self._fit_any(source_points, target_points, alpha, centers, max_residual, alphas)
+
+        if stats is not None:
+            stats.record('tps_points', source_points.shape[0])
+            stats.record('tps_centers', self.source_points.shape[0])
+            stats.record('tps_residual', self.residual)
+
+    def _fit_any(self, source_points, target_points, alpha, centers, max_residual, alphas=None):
+        """
+        *assistant func* exact or reduced fit, see `__init__`
+        """
         p, d = source_points.shape
 
+        if isinstance(alpha, str):
+            if alpha not in ALPHA_CRITERIA:
+                raise ValueError(
+                    f'Unknown `alpha` selection `{alpha}`, expected one of {ALPHA_CRITERIA}.')
+            if centers is not None:
+                raise ValueError('Selecting `alpha` is only supported without `centers`.')
+            self._fit_select(source_points, target_points, alpha, alphas)
+            return
+
+        if centers is None:
+            if max_residual is not None:
+                raise ValueError('`max_residual` is only supported with `centers`.')
+            self._fit(source_points, target_points, alpha)
+            return
+
+        if numpy.ndim(centers) == 0:
+            center_points = source_points[farthest_point_centers(source_points, centers)]
+        else:
+            center_points = _2darray(centers)
+            assert center_points.shape[1] == d, \
+                f'Dimension of `centers` (d={center_points.shape[1]})' \
+                f' not match with `source_points` (d={d}).'
+
+        residual = self._fit_reduced(source_points, target_points, alpha, center_points)
+        if max_residual is None:
+            return
+
+        limit = max(center_points.shape[0], int(MAX_CENTER_FRACTION *p))
+        while self.residual > max_residual and center_points.shape[0] < limit:
+            # add the worst fitted control points that are no centers yet, at
+            # most doubling the centers
+            error = numpy.max(numpy.abs(residual), axis=1)
+            error[numpy.isin(_row_keys(source_points), _row_keys(center_points))] = -1
+            worst = numpy.argsort(error)[::-1]
+            worst = worst[:min(center_points.shape[0], limit -center_points.shape[0])]
+            worst = worst[error[worst] >= 0]
+            if len(worst) == 0:
+                break
+            center_points = numpy.unique(
+                numpy.vstack([center_points, source_points[worst]]), axis=0)
+            residual = self._fit_reduced(source_points, target_points, alpha, center_points)
+
+        if self.residual > max_residual:
+            warnings.warn(
+                f'Residual {self.residual:.3g} is above `max_residual` {max_residual:.3g}'
+                f' with {center_points.shape[0]} of {p} control points as centers;'
+                ' fit without `centers` to interpolate them exactly.', RuntimeWarning,
+                stacklevel=3)
+
+    def _fit(self, source_points, target_points, alpha):
+        """
+        *assistant func* exact (regularized) interpolation on every control
+        point
+        """
+        # solve for M*X = Y.
+        # At least d+1 control points should not be in a subspace; e.g. for d=2, at
+        # least 3 points are not on a straight line. Otherwise M will be singular.
+        # Coordinates constant over all control points (as the planar template of
+        # `IdentityEmbdding`) are the exception: their affine term is fixed to 0.
+        self._affine = _affine_dims(source_points)
+        self._factor = _factorize(self._system(source_points, alpha), self.stats)
+        self._basis = None
+        self._reduced = False
+
+        self.source_points = source_points
+        self._solve(target_points)
+
+    def _fit_select(self, source_points, target_points, criterion, alphas):
+        """
+        *assistant func* exact fit with `alpha` chosen among `alphas` from a
+        single eigendecomposition.
+
+        With the QR decomposition V = [Q1 Q2] * [R; 0] and the
+        eigendecomposition Q2^T*K*Q2 = U*diag(lam)*U^T, G = Q2*U and
+        z = G^T*Y, for every alpha
+
+            ```math
+            W = G * (z / (lam + alpha))
+            I - H = alpha * G * diag(1 / (lam + alpha)) * G^T
+            ```
+
+        where H maps the targets to the fitted values. The residual is
+        alpha*W, so the GCV score p*|alpha*W|^2 / tr(I - H)^2 costs O(m)
+        and the leave-one-out residuals alpha*W / diag(I - H) cost O(p*m)
+        per candidate.
+        """
+        p = source_points.shape[0]
+        self._affine = _affine_dims(source_points)
+        self._basis = None
+        self._reduced = False
+
+        V = numpy.hstack([numpy.ones((p, 1)), source_points[:, self._affine]])
+        k = V.shape[1]
+
+        Q, R = numpy.linalg.qr(V, mode='complete')
+        R = R[:k]
+        if p <= k or numpy.min(numpy.abs(numpy.diag(R))) <= 1E-12 *numpy.max(numpy.abs(R)):
+            raise numpy.linalg.LinAlgError('Singular matrix')
+
+        K = pairwise_radial_basis(source_points, source_points)
+        Q2 = Q[:, k:]
+        lam, U = numpy.linalg.eigh(numpy.dot(Q2.T, numpy.dot(K, Q2)))
+        G = numpy.dot(Q2, U)
+        z = numpy.dot(G.T, target_points)
+
+        if alphas is None:
+            alphas = numpy.logspace(-8, 1, ALPHA_CANDIDATES) *numpy.max(numpy.abs(lam))
+        alphas = numpy.asarray(alphas, dtype=float).reshape(-1)
+        assert numpy.all(alphas > 0), 'Candidates in `alphas` should be positive.'
+
+        if criterion == 'loo':
+            G2 = G *G
+
+        scores = numpy.empty(alphas.shape)
+        for i, alpha in enumerate(alphas):
+            shrink = alpha / (lam +alpha)
+            if criterion == 'gcv':
+                scores[i] = p *numpy.sum((shrink[:, None] *z) **2) / numpy.sum(shrink) **2
+            else:
+                residual = numpy.dot(G, shrink[:, None] *z)
+                scores[i] = numpy.mean(
+                    numpy.sum((residual / numpy.dot(G2, shrink)[:, None]) **2, axis=1))
+
+        alpha = float(alphas[numpy.argmin(scores)])
+        self.alpha = alpha
+        self.alpha_scores = alphas, scores
+
+        # coefficients of the chosen alpha; V*a = Y - (K + alpha*I)*W
+        W = numpy.dot(G, z / (lam +alpha)[:, None])
+        a = numpy.linalg.solve(R, numpy.dot(Q[:, :k].T, target_points - numpy.dot(K, W) - alpha *W))
+
+        self.source_points = source_points
+        self.coef = self._expand_affine(numpy.vstack([W, a]))
+        self.residual = float(numpy.max(numpy.abs(alpha *W), initial=0))
+
+        # `refit` factorizes the system of the chosen alpha on first use
+        self._factor = None
+
+        if self.stats is not None:
+            self.stats.record('tps_alpha', alpha)
+
+    def _system(self, source_points, alpha) -> numpy.ndarray:
+        """
+        *assistant func* system matrix M of the exact fit
+        """
+        p = source_points.shape[0]
+        k = len(self._affine)
+
         # This correcponds to the matrix A from [1]
         A = pairwise_radial_basis(source_points, source_points)
 
@@ -135,56 +515,525 @@ class TPS(Embdding):
         # This correcponds to V from [1]
         V = numpy.hstack([
             numpy.ones((p, 1)),
-            source_points
+            source_points[:, self._affine]
         ])
 
-        # Target points
-        M = numpy.vstack([
+        return numpy.vstack([
             numpy.hstack([A, V]),
-            numpy.hstack([V.T, numpy.zeros((d+1, d+1))])
+            numpy.hstack([V.T, numpy.zeros((k+1, k+1))])
         ])
-        Y = numpy.vstack([target_points, numpy.zeros((d+1, d))])
 
-        # solve for M*X = Y.
-        # At least d+1 control points should not be in a subspace; e.g. for d=2, at
-        # least 3 points are not on a straight line. Otherwise M will be singular.
-        X = numpy.linalg.solve(M, Y)
+    def _expand_affine(self, X) -> numpy.ndarray:
+        """
+        *assistant func* coefficients with zero rows for the affine terms of
+        constant coordinates
+        """
+        n = X.shape[0] - len(self._affine)
+        if len(self._affine) == self.d:
+            return X
 
-        self.source_points = source_points
-        self.d = d
-        self.coef = X
+        coef = numpy.zeros((n +self.d, X.shape[1]))
+        coef[:n] = X[:n]
+        coef[n +self._affine] = X[n:]
+        return coef
 
-    def __call__(self, points) -> numpy.ndarray:
+    def _solve(self, target_points):
+        """
+        *assistant func* coefficients for `target_points` from the kept
+        factorization
+        """
+        from scipy.linalg import lu_solve
+
+        p = self.control_points.shape[0]
+        k = len(self._affine)
+
+        if not self._reduced:
+            # exact fit: M * X = [Y; 0]
+            Y = numpy.vstack([target_points, numpy.zeros((k+1, target_points.shape[1]))])
+            X = lu_solve(self._factor, Y, check_finite=False)
+
+            self.coef = self._expand_affine(X)
+
+            # (A + alpha*I)*W + V*a = Y, so the misfit is alpha*W
+            self.residual = float(numpy.max(numpy.abs(self.alpha *X[:p]), initial=0))
+            return None
+
+        # reduced fit: R*y = Q_p^T*Y, with x = [Z*y_w; y_a]
+        from scipy.linalg import solve_triangular
+
+        Q_p = self._basis
+        R, Z = self._factor
+
+        projected = numpy.dot(Q_p.T, target_points)
+        y = solve_triangular(R, projected, check_finite=False)
+        X = numpy.vstack([numpy.dot(Z, y[:Z.shape[1]]), y[Z.shape[1]:]])
+
+        # B*x = Q_p*R*y, the projection of Y
+        residual = numpy.dot(Q_p, projected) - target_points
+
+        self.coef = self._expand_affine(X)
+        self.residual = float(numpy.max(numpy.abs(residual)))
+        return residual
+
+    def refit(self, target_points) -> 'TPS':
+        """
+        Replace the targets of this spline, keeping its control points,
+        centers and `alpha`. Gives the same coefficients as a fresh fit.
+
+        ## Arguments
+            + `target_points` - p by d vector of new targets for the control
+                                points this spline was fitted on.
+
+        ## Returns
+            this instance.
+        """
+        target_points = _2darray(target_points)
+        assert target_points.shape == self.control_points.shape, \
+            f'Size of `target_points` {target_points.shape} does not equal' \
+            f' to the control points {self.control_points.shape}.'
+
+        with stage(self.stats, 'tps_fit'):
+            if getattr(self, '_factor', None) is None:
+                self._refactorize()
+
+            self._solve(target_points)
+        return self
+
+    def with_targets(self, target_points) -> 'TPS':
+        """
+        Like `refit`, but returns a new spline sharing the control points
+        and the factorization with this one.
+        """
+        return copy.copy(self).refit(target_points)
+
+    def _refactorize(self):
+        """
+        *assistant func* rebuild the factorization dropped when pickling or
+        loading
+        """
+        if not self._reduced:
+            self._factor = _factorize(self._system(self.control_points, self.alpha))
+        else:
+            self._fit_reduced_factor(self.control_points, self.alpha, self.source_points)
+
+    def __getstate__(self):
+        # the factorization is O(p^2) and the reduced basis O(p*c); refit
+        # rebuilds both on demand
+        state = self.__dict__.copy()
+        state['_factor'] = None
+        state['_basis'] = None
+        state['stats'] = None
+        return state
+
+    def _fit_reduced(self, source_points, target_points, alpha, center_points):
+        """
+        *assistant func* regularized least squares on the radial basis of
+        `center_points` only:
+
+            ```math
+            min |B*x - Y|^2 + alpha * W^T*K_cc*W    s.t. V_c^T*W = 0
+                where B = [K_pc V], x = [W; a]
+            ```
+
+        With Z spanning the null space of V_c^T, W = Z*w removes the
+        constraint, and L^T*L = Z^T*K_cc*Z turns the penalty into rows of a
+        least squares problem solved by QR, without squaring the condition
+        number of B as the normal equations would:
+
+            ```math
+            min |[K_pc*Z V; sqrt(alpha)*L 0] * [w; a] - [Y; 0]|^2
+            ```
+
+        returns the residual B*x - Y at every control point
+        """
+        self._affine = _affine_dims(source_points)
+        self._fit_reduced_factor(source_points, alpha, center_points)
+
+        self.source_points = center_points
+        return self._solve(target_points)
+
+    def _fit_reduced_factor(self, source_points, alpha, center_points):
+        """
+        *assistant func* QR factorization of the reduced fit; keeps the
+        rows Q_p of Q on the control points as `_basis` and R and Z as
+        `_factor`
+        """
+        p = source_points.shape[0]
+        c = center_points.shape[0]
+        k = len(self._affine)
+
+        # null space of the side conditions V_c^T*W = 0 of [1]
+        V_c = numpy.hstack([
+            numpy.ones((c, 1)),
+            center_points[:, self._affine]
+        ])
+        Q_c, R_c = numpy.linalg.qr(V_c, mode='complete')
+        if c <= k +1 or numpy.min(numpy.abs(numpy.diag(R_c))) <= 1E-12 *numpy.max(numpy.abs(R_c)):
+            raise numpy.linalg.LinAlgError('Singular matrix')
+        Z = Q_c[:, k +1:]
+
+        A = numpy.hstack([
+            numpy.dot(pairwise_radial_basis(source_points, center_points), Z),
+            numpy.ones((p, 1)),
+            source_points[:, self._affine]
+        ])
+        if alpha:
+            # K_cc is positive semi-definite on the null space
+            lam, U = numpy.linalg.eigh(
+                numpy.dot(Z.T, numpy.dot(pairwise_radial_basis(center_points, center_points), Z)))
+            L = numpy.sqrt(alpha *numpy.maximum(lam, 0))[:, None] *U.T
+            A = numpy.vstack([A, numpy.hstack([L, numpy.zeros((L.shape[0], k +1))])])
+
+        Q, R = numpy.linalg.qr(A)
+        diag = numpy.abs(numpy.diag(R))
+        if numpy.min(diag) <= 1E-12 *numpy.max(diag):
+            raise numpy.linalg.LinAlgError('Singular matrix')
+
+        if self.stats is not None:
+            from scipy.linalg.lapack import dtrcon
+            rcond, _ = dtrcon(R, norm='1')
+            self.stats.record('tps_size', R.shape[0])
+            self.stats.record('tps_condition', 1 / rcond if rcond > 0 else numpy.inf)
+
+        self._factor = R, Z
+        self._basis = Q[:p]
+        self._reduced = True
+
+    def __call__(
+        self,
+        points,
+        block_size  :int = None,
+        max_bytes   :int = None,
+        out         :numpy.ndarray = None,
+        workers     :int = None,
+        executor    = 'thread'
+    ) -> numpy.ndarray:
         """
         Given a set of control points and mapping coefficients, compute a
         deformed surface f(S) using a thin plate spline radial basis function
         phi(r) as shown in [1].
 
         ## Arguments
-            + `points` - n by 3 matrix of X, Y, Z components of the surface
+            + `points`     - n by 3 matrix of X, Y, Z components of the surface
+            + `block_size` - evaluate at most this many points at once
+            + `max_bytes`  - keep the per-block intermediates under this many
+                             bytes; defaults to `EVAL_BLOCK_BYTES` when neither
+                             is given
+            + `out`        - optional n by 3 array the result is written into
+            + `workers`    - number of blocks evaluated concurrently; `None`
+                             or 1 evaluates serially
+            + `executor`   - pool for `workers`: `'thread'`; `'process'`, a
+                             new process pool that receives the model once
+                             per worker; or a `concurrent.futures.Executor` to
+                             reuse across calls, which receives it once per
+                             worker and call. Threads suffice as cdist, log
+                             and the matrix product release the GIL.
 
         ## Returns
             n by 3 vectors of X, Y, Z compoments of the deformed surface.
+            The blocks do not depend on `workers` or `executor`, so neither
+            changes the result.
 
         ## References
             1. http://en.wikipedia.org/wiki/Polyharmonic_spline
         """
+        points = self._check_points(points)
+
+        n = points.shape[0]
+        if out is None:
+            out = numpy.empty((n, self.coef.shape[1]))
+        assert out.shape == (n, self.coef.shape[1]), \
+            f'Shape of `out` {out.shape} does not match' \
+            f' ({n}, {self.coef.shape[1]}).'
+
+        if block_size is None and max_bytes is None:
+            max_bytes = EVAL_BLOCK_BYTES
+
+        rows = _block_rows(n, self.source_points.shape[0], block_size, max_bytes)
+        blocks = [slice(start, start +rows) for start in range(0, n, rows)]
+
+        with stage(self.stats, 'evaluate'):
+            self._evaluate_blocks(points, out, blocks, workers, executor)
+
+        return out
+
+    def _evaluate_blocks(self, points, out, blocks, workers, executor):
+        """
+        *assistant func* evaluate `blocks` of `points` into `out`, serially
+        or on a pool
+        """
+        if workers is None or workers <= 1 or len(blocks) <= 1:
+            for block in blocks:
+                self._evaluate(points[block], out[block])
+
+        elif executor == 'thread':
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(workers) as pool:
+                list(pool.map(
+                    lambda block: self._evaluate(points[block], out[block]),
+                    blocks
+                ))
+
+        elif executor == 'process':
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(
+                    workers, initializer=_set_worker_tps, initargs=(self,)) as pool:
+                results = pool.map(_evaluate_worker_block, [points[block] for block in blocks])
+                for block, result in zip(blocks, results):
+                    out[block] = result
+
+        else:
+            from concurrent.futures import Executor
+            if not isinstance(executor, Executor):
+                raise ValueError(f'Unknown executor `{executor}`.')
+
+            # one task, and one copy of the model, per worker
+            groups = [blocks[k::workers] for k in range(min(workers, len(blocks)))]
+            futures = [
+                executor.submit(_evaluate_block_list, self, [points[block] for block in group])
+                for group in groups
+            ]
+            for group, future in zip(groups, futures):
+                for block, result in zip(group, future.result()):
+                    out[block] = result
+
+    def iter_evaluate(
+        self,
+        points,
+        block_size  :int = None,
+        max_bytes   :int = None
+    ):
+        """
+        Generator version of `__call__`; yields the deformed points block by
+        block, in order, so that the whole result never needs to be held.
+
+        ## Arguments
+            + `points`     - n by d matrix of points
+            + `block_size` - yield at most this many points at once
+            + `max_bytes`  - keep the per-block intermediates under this many
+                             bytes
+        """
+        points = self._check_points(points)
+
+        n = points.shape[0]
+        rows = _block_rows(n, self.source_points.shape[0], block_size, max_bytes)
+        for start in range(0, n, rows):
+            block = points[start:start +rows]
+            yield self._evaluate(block, numpy.empty((block.shape[0], self.coef.shape[1])))
+
+    def plan(self, points):
+        """
+        An `EvaluationPlan` of this spline's source points on `points`.
+        """
+        from .plan import EvaluationPlan
+        return EvaluationPlan(points, self.source_points)
+
+    def _check_points(self, points) -> numpy.ndarray:
         points = _2darray(points)
         assert points.shape[1] == self.d, \
             f'Dimension of input array (d={points.shape[1]})' \
             f' not match with this instance (d={self.d}).'
+        return points
 
-        n = points.shape[0]
+    def _evaluate(self, points, out) -> numpy.ndarray:
+        """
+        *assistant func* evaluate a block of points into `out`, without
+        building the `[A V]` matrix
+        """
+        p = self.source_points.shape[0]
 
         A = pairwise_radial_basis(points, self.source_points)
-        V = numpy.hstack([
-            numpy.ones((n, 1)),
-            points
-        ])
+        numpy.matmul(A, self.coef[:p], out=out)
+        del A
 
-        f_surface = numpy.dot(
-            numpy.hstack([A, V]),
-            self.coef
-        )
+        # affine part V = [1 points]
+        out += self.coef[p]
+        out += numpy.dot(points, self.coef[p+1:])
+        return out
+
+    def jacobian(self, points) -> numpy.ndarray:
+        """
+        Closed-form derivative of the deformation at the given points.
+
+        ## Arguments
+            + `points` - n by d matrix of points
+
+        ## Returns
+            n by d by d array where `[i, j, k]` is the derivative of output
+            component j with respect to input component k at point i.
+        """
+        points = self._check_points(points)
+
+        p = self.source_points.shape[0]
+        W = self.coef[:p]
+        C = self.coef[p+1:]
+
+        D = pairwise_radial_basis_derivative(points, self.source_points)
+        DW = numpy.dot(D, W)
+
+        jacobian = numpy.empty((points.shape[0], W.shape[1], self.d))
+        for k in range(self.d):
+            DSW = numpy.dot(D, self.source_points[:, k, None] *W)
+            jacobian[:, :, k] = points[:, k, None] *DW - DSW + C[k]
+
+        return jacobian
+
+
+def batched_radial_basis(A, B) -> numpy.ndarray:
+    """
+    `pairwise_radial_basis` for a stack of problems.
+
+    ## Arguments
+        + `A` - b by n by d array, or n by d shared by all problems.
+        + `B` - b by m by d array.
+
+    ## Returns
+        b by n by m array.
+    """
+    if A.ndim == 2:
+        A = A[None]
+
+    # squared distances, one coordinate at a time
+    r2_mat = numpy.zeros((max(A.shape[0], B.shape[0]), A.shape[1], B.shape[1]))
+    for k in range(A.shape[2]):
+        diff = A[:, :, None, k] - B[:, None, :, k]
+        diff *= diff
+        r2_mat += diff
+    del diff
+
+    # phi(r) = r^2*log(r) = r^2*log(r^2)/2
+    log_r2 = numpy.zeros(r2_mat.shape)
+    numpy.log(r2_mat, out=log_r2, where=r2_mat > 0)
+
+    P = r2_mat
+    P *= log_r2
+    P /= 2
+
+    return P
+
+
+class BatchedTPS:
+    """
+    Many independent thin plate splines of the same size, fitted and
+    evaluated together
+    """
+
+    def __init__(
+        self,
+        source_points   :numpy.ndarray,
+        target_points   :numpy.ndarray,
+        alpha           = 0
+    ):
+        """
+        Fit b splines with one batched solve.
+
+        ## Arguments
+            + `source_points` - b by p by d array of control points.
+            + `target_points` - b by p by d array of corresponding targets.
+            + `alpha`         - regularization parameter, a scalar or one per
+                                problem.
+
+        ## Raises
+            `numpy.linalg.LinAlgError` when any of the systems is singular.
+        """
+        source_points = numpy.array(source_points, dtype=float)
+        target_points = numpy.array(target_points, dtype=float)
+        assert source_points.ndim == 3, \
+            f'`source_points` should be b by p by d, got {source_points.shape}.'
+        assert source_points.shape == target_points.shape, \
+            f'Size of `source_points` {source_points.shape} does not equal' \
+            f' to `target_points` {target_points.shape}.'
+
+        b, p, d = source_points.shape
+        alpha = numpy.broadcast_to(numpy.array(alpha, dtype=float), (b,))
+
+        # the systems of `TPS`, stacked
+        M = numpy.zeros((b, p +d +1, p +d +1))
+        M[:, :p, :p] = batched_radial_basis(source_points, source_points)
+        M[:, :p, :p] += alpha[:, None, None] *numpy.identity(p)[None]
+        M[:, :p, p] = 1
+        M[:, :p, p+1:] = source_points
+        M[:, p, :p] = 1
+        M[:, p+1:, :p] = source_points.transpose(0, 2, 1)
+
+        Y = numpy.zeros((b, p +d +1, d))
+        Y[:, :p] = target_points
+
+        self.source_points = source_points
+        self.alpha = alpha
+        self.d = d
+        self.coef = numpy.linalg.solve(M, Y)
+
+    def __len__(self):
+        return self.source_points.shape[0]
+
+    def __getitem__(self, index) -> TPS:
+        """
+        The fitted spline of problem `index` as a standalone `TPS`; its
+        factorization is rebuilt on the first `refit`.
+        """
+        p = self.source_points.shape[1]
+
+        tps = TPS.__new__(TPS)
+        tps.d = self.d
+        tps.alpha = self.alpha[index]
+        tps.control_points = self.source_points[index]
+        tps.source_points = self.source_points[index]
+        tps.coef = self.coef[index]
+        tps.residual = float(numpy.max(numpy.abs(tps.alpha *tps.coef[:p]), initial=0))
+        tps._factor = None
+        tps._basis = None
+        tps._reduced = False
+        tps._affine = numpy.arange(self.d)
+        return tps
+
+    def __call__(
+        self,
+        points,
+        block_size  :int = None,
+        max_bytes   :int = None
+    ) -> numpy.ndarray:
+        """
+        Evaluate every spline.
+
+        ## Arguments
+            + `points`     - n by d matrix shared by all problems, or b by n by
+                             d array of points per problem
+            + `block_size`, `max_bytes` - see `TPS.__call__`
+
+        ## Returns
+            b by n by d array.
+        """
+        points = numpy.array(points, dtype=float)
+        assert points.shape[-1] == self.d, \
+            f'Dimension of input array (d={points.shape[-1]})' \
+            f' not match with this instance (d={self.d}).'
+
+        b, p, d = self.source_points.shape
+        n = points.shape[-2]
+        if points.ndim == 3:
+            assert points.shape[0] == b, \
+                f'Got points for {points.shape[0]} problems, expected {b}.'
+
+        out = numpy.empty((b, n, self.coef.shape[2]))
+
+        # small blocks keep the b*p wide basis rows in cache
+        if block_size is None and max_bytes is None:
+            max_bytes = BATCH_BLOCK_BYTES
+
+        rows = _block_rows(n, b *p, block_size, max_bytes)
+        for start in range(0, n, rows):
+            block = points[..., start:start +rows, :]
+
+            if block.ndim == 2:
+                # shared points: one cdist against every problem's sources
+                A = pairwise_radial_basis(block, self.source_points.reshape(-1, d))
+                A = A.reshape(block.shape[0], b, p).transpose(1, 0, 2)
+            else:
+                A = batched_radial_basis(block, self.source_points)
+
+            out[:, start:start +rows] = numpy.matmul(A, self.coef[:, :p]) \
+                + self.coef[:, p, None] \
+                + numpy.matmul(block, self.coef[:, p+1:])
 
-        return f_surface
+        return out
@@ -0,0 +1,327 @@
+"""
+Approximate evaluation of a fitted 2-dimensional thin plate spline.
+
+The source points are binned into cells. Cells far enough from a group of
+query points are summed through a truncated multipole expansion around the
+cell center, the others exactly. With complex coordinates z (query) and t
+(source, both relative to the cell center), [1]
+
+    ```math
+    |z-t|^2 * log|z-t| = Re[ |z-t|^2 * (log(z) - sum_k (t/z)^k / k) ]
+    ```
+
+so that every cell is summarized by the moments `sum(w * t^k)` and
+`sum(w * conj(t) * t^k)`. Truncating after `order` terms leaves a remainder
+below
+
+    ```math
+    sum(|w|) * rho^2 * q^(order-1) * (1+q)^2 / ((order+1) * (1-q)),
+        q = rho / |z|
+    ```
+
+Cells are kept in a quadtree and, walking down from the coarsest level, a
+cell is expanded when its bound is below its share of `tol` (proportional
+to `sum(|w|)` of the cell) and refined otherwise, so the total error of every
+output component stays below `tol`.
+
+## References
+    1. R. K. Beatson and W. A. Light, Fast evaluation of radial basis
+       functions: methods for two-dimensional polyharmonic splines,
+       IMA Journal of Numerical Analysis 17 (1997)
+"""
+from .base import Embdding
+from .tps import TPS, pairwise_radial_basis
+
+import numpy
+
+from ..stats import stage
+
+
+def _cell_index(points, origin, width) -> numpy.ndarray:
+    """
+    *assistant func* integer grid cell of every point
+    """
+    return numpy.floor((points - origin) / width).astype(numpy.int64)
+
+
+def _group(keys):
+    """
+    *assistant func* group rows with identical keys; returns the order that
+    sorts rows by group and the boundaries of every group in that order
+    """
+    _, inverse = numpy.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = numpy.argsort(inverse, kind='stable')
+    bounds = numpy.flatnonzero(numpy.diff(inverse[order])) +1
+    bounds = numpy.concatenate([[0], bounds, [len(order)]])
+    return order, bounds
+
+
+def _complex(points) -> numpy.ndarray:
+    """
+    *assistant func* 2d points as complex numbers
+    """
+    return points[..., 0] + 1j *points[..., 1]
+
+
+class _Level:
+    """
+    *assistant func* the cells of one level of the hierarchy and their
+    multipole moments, in units of `scale` to keep high powers bounded
+    """
+
+    def __init__(self, keys, source, W, powers, scale):
+        self.scale = scale
+        order, bounds = _group(keys)
+        self.keys = keys[order[bounds[:-1]]]
+
+        self.members = [order[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+        ncells = len(self.members)
+        m = W.shape[1]
+        self.centers = numpy.empty((ncells, 2))
+        self.radius = numpy.empty(ncells)
+        self.abs_weight = numpy.empty(ncells)
+        self.moment_a = numpy.empty((ncells, len(powers), m), dtype=complex)
+        self.moment_b = numpy.empty((ncells, len(powers), m), dtype=complex)
+
+        for i, idx in enumerate(self.members):
+            pts = source[idx]
+            w = W[idx]
+
+            c = numpy.mean(pts, axis=0)
+            t = _complex(pts - c)
+            self.centers[i] = c
+            self.radius[i] = numpy.max(numpy.abs(t))
+
+            t = t / scale
+            tk = t[:, None] **powers[None, :]
+
+            self.abs_weight[i] = numpy.max(numpy.sum(numpy.abs(w), axis=0))
+            self.moment_a[i] = numpy.dot(tk.T, w)
+            self.moment_b[i] = numpy.dot((numpy.conj(t)[:, None] *tk).T, w)
+
+
+class ApproxTPS(Embdding):
+    """
+    Fast approximate evaluator of a fitted 2-dimensional `TPS`
+    """
+
+    def __init__(
+        self,
+        tps         :TPS,
+        tol         :float = 1E-6,
+        order       :int = 24,
+        leaf_size   :int = 32,
+        stats       = None
+    ):
+        """
+        ## Arguments
+            + `tps`       - the fitted thin plate spline, with d=2
+            + `tol`       - bound on the absolute truncation error of every
+                            output component; floating point rounding of the
+                            sums comes on top of it
+            + `order`     - number of terms of the multipole expansion
+            + `leaf_size` - average number of source points per finest cell
+            + `stats`     - optional `sft.Stats` collecting the `evaluate`
+                            timing and counting the `approx_far_cells`
+                            summed by expansion and the `approx_exact_pairs`
+                            of query and source points summed exactly
+        """
+        if not isinstance(tps, TPS):
+            raise TypeError('`tps` is not a TPS instance.')
+        if tps.d != 2:
+            raise ValueError(
+                f'ApproxTPS only supports 2-dimensional splines (d={tps.d}).')
+
+        source = tps.source_points
+        p = source.shape[0]
+        W = tps.coef[:p]
+
+        self.tps = tps
+        self.d = tps.d
+        self.tol = float(tol)
+        self.order = int(order)
+        self.stats = stats
+
+        # finest cell width so that cells hold about `leaf_size` points
+        self.origin = numpy.min(source, axis=0)
+        extent = numpy.max(source, axis=0) - self.origin
+        area = numpy.prod(numpy.maximum(extent, 1E-12))
+        ncells = max(p / max(int(leaf_size), 1), 1)
+        self.width = max(numpy.sqrt(area / ncells), 1E-12)
+
+        # levels of the quadtree, finest first; every coarser level merges
+        # 2x2 cells until only a handful remain
+        powers = numpy.arange(self.order +2)
+        keys = _cell_index(source, self.origin, self.width)
+
+        scale = self.width
+        self.levels = [_Level(keys, source, W, powers, scale)]
+        while len(self.levels[-1].members) > 16:
+            keys = keys // 2
+            scale = scale *2
+            self.levels.append(_Level(keys, source, W, powers, scale))
+
+        # children of every cell, as indices into the next finer level; the
+        # groups of the parent keys come in the order of the coarse cells
+        for coarse, fine in zip(self.levels[1:], self.levels[:-1]):
+            order, bounds = _group(fine.keys // 2)
+            coarse.children = [order[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+        self.total_weight = numpy.sum(self.levels[0].abs_weight)
+
+        # binomial part of the local re-expansion, see `_far_field`
+        from scipy.special import comb
+
+        ks = numpy.arange(self.order +1)
+        self._local_coef = numpy.empty((self.order +1, self.order +1))
+        self._local_coef[0, 1:] = (-1.) **(ks[1:] +1) / ks[1:]
+        self._local_coef[0, 0] = 0
+        for k in ks[1:]:
+            self._local_coef[k] = -(-1.) **ks *comb(k +ks -1, ks) / k
+
+    def __call__(self, points) -> numpy.ndarray:
+        """
+        Approximately evaluate the spline; see `TPS.__call__`.
+        """
+        points = self.tps._check_points(points)
+
+        with stage(self.stats, 'evaluate'):
+            return self._evaluate(points)
+
+    def _evaluate(self, points) -> numpy.ndarray:
+        """
+        *assistant func* approximate evaluation of checked `points`
+        """
+        p = self.tps.source_points.shape[0]
+        coef = self.tps.coef
+        far_count = 0
+        exact_count = 0
+
+        # affine part is exact
+        out = coef[p] + numpy.dot(points, coef[p+1:])
+
+        order, bounds = _group(_cell_index(points, self.origin, self.width))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            idx = order[start:stop]
+            pts = points[idx]
+
+            c = numpy.mean(pts, axis=0)
+            rho_q = numpy.max(numpy.linalg.norm(pts - c, axis=1))
+
+            # walk down from the coarsest level, collecting accepted cells and
+            # refining the others
+            far_cells = []
+            candidates = numpy.arange(len(self.levels[-1].members))
+            for ilevel in range(len(self.levels) -1, -1, -1):
+                level = self.levels[ilevel]
+
+                far = self._accept(level, candidates, c, rho_q)
+                if numpy.any(far):
+                    far_cells.append((level, candidates[far]))
+
+                rejected = candidates[~far]
+                if ilevel == 0 or len(rejected) == 0:
+                    break
+                candidates = numpy.concatenate([level.children[i] for i in rejected])
+
+            if far_cells:
+                out[idx] += self._far_field(far_cells, pts, c)
+                far_count += sum(len(cells) for _, cells in far_cells)
+
+            if ilevel == 0 and len(rejected):
+                src_idx = numpy.concatenate([level.members[i] for i in rejected])
+                A = pairwise_radial_basis(pts, self.tps.source_points[src_idx])
+                out[idx] += numpy.dot(A, coef[src_idx])
+                exact_count += A.size
+
+        if self.stats is not None:
+            self.stats.count('approx_far_cells', far_count)
+            self.stats.count('approx_exact_pairs', exact_count)
+
+        return out
+
+    def jacobian(self, points) -> numpy.ndarray:
+        return self.tps.jacobian(points)
+
+    def _accept(self, level, cells, c, rho_q) -> numpy.ndarray:
+        """
+        *assistant func* mask of `cells` whose expansion is accurate enough
+        for the query group centered at `c` with radius `rho_q`; every cell
+        gets a share of `tol` proportional to its weight so that the
+        accepted, disjoint cells stay below `tol` in total
+        """
+        dist = numpy.linalg.norm(level.centers[cells] - c, axis=1)
+        rho = level.radius[cells] + rho_q
+
+        far = dist > rho
+        q = rho[far] / dist[far]
+        weight = level.abs_weight[cells][far]
+
+        # remainder of the multipole expansion plus that of its local
+        # re-expansion around the query group
+        bound = 2 *weight *rho[far] **2 *q **(self.order -1) \
+              * (1 +q) **2 / ((self.order +1) *(1 -q))
+        budget = self.tol *weight / self.total_weight
+
+        far[far] = bound <= budget
+        return far
+
+    def _far_field(self, far_cells, points, c) -> numpy.ndarray:
+        """
+        *assistant func* sum the expansions of the accepted cells at `points`
+        through a single local expansion around the query group center `c`
+        """
+        K = self.order
+        ks = numpy.arange(K +1)
+
+        z0 = numpy.concatenate([
+            _complex(c - level.centers[cells]) for level, cells in far_cells])
+        scale = numpy.concatenate([
+            numpy.full(len(cells), level.scale) for level, cells in far_cells])
+        a = numpy.concatenate([level.moment_a[cells] for level, cells in far_cells])
+        b = numpy.concatenate([level.moment_b[cells] for level, cells in far_cells])
+
+        u = _complex(points - c)
+        rho_q = numpy.max(numpy.abs(u))
+        if rho_q == 0:
+            rho_q = 1.
+
+        # T[:, k, l] is the coefficient of u^l in g_k(z0 + u), with
+        # g_0 = log(z) and g_k = -z^-k / k, times scale^k * rho_q^l
+        ratio_s = (scale / z0)[:, None] **ks[None, :]
+        ratio_q = (rho_q / z0)[:, None] **ks[None, :]
+
+        T = self._local_coef[None] *ratio_s[:, :, None] *ratio_q[:, None, :]
+        T[:, 0, 0] = numpy.log(z0)
+
+        # Taylor coefficients of F = sum_k g_k * moment_k for the four moment
+        # series of |z|^2 a_k - z b_k - conj(z) a_{k+1} + b_{k+1}; the stored
+        # moments are in units of scale^k, b_k and a_{k+1} of scale^(k+1)
+        m = a.shape[2]
+        moments = numpy.concatenate([a[:, :K+1], b[:, :K+1], a[:, 1:], b[:, 1:]], axis=2)
+        L = numpy.matmul(T.transpose(0, 2, 1), moments)
+
+        s = scale[:, None, None]
+        L0 = L[:, :, :m]
+        L1 = L[:, :, m:2 *m] *s
+        L2 = L[:, :, 2 *m:3 *m] *s
+        L3 = L[:, :, 3 *m:] *s **2
+
+        # with z = z0 + u: |z|^2 = |u|^2 + u conj(z0) + conj(u) z0 + |z0|^2
+        zc = numpy.conj(z0)[:, None, None]
+        zz = z0[:, None, None]
+        H_uu = numpy.sum(L0, axis=0)
+        H_u = numpy.sum(zc *L0 - L1, axis=0)
+        H_ubar = numpy.sum(zz *L0 - L2, axis=0)
+        H_1 = numpy.sum(numpy.abs(zz) **2 *L0 - zz *L1 - zc *L2 + L3, axis=0)
+
+        U = (u / rho_q)[:, None] **ks[None, :]
+
+        total = (numpy.abs(u) **2)[:, None] *numpy.dot(U, H_uu) \
+              + u[:, None] *numpy.dot(U, H_u) \
+              + numpy.conj(u)[:, None] *numpy.dot(U, H_ubar) \
+              + numpy.dot(U, H_1)
+
+        return numpy.real(total)
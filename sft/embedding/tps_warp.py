@@ -6,6 +6,161 @@ from itertools import groupby
 import numpy
 
 
+def match_points(keypoints_template, keypoints_image, matches, cluster_labels):
+    """
+    Keep the best match of every cluster of template keypoints.
+
+    ## Returns
+        + p by 2 matrix of the matched template keypoint positions
+        + p by 2 matrix of the matched image keypoint positions
+    """
+    matches = sorted(matches, key=lambda m: cluster_labels[m.queryIdx])
+
+    source_pt = []
+    target_pt = []
+    for _, cluster in groupby(matches, lambda m: cluster_labels[m.queryIdx]):
+        cluster = list(cluster)
+
+        if len(cluster) == 1:
+            match = cluster[0]
+        else:
+            match = min(cluster, key=lambda m: m.distance)
+
+        kp_from = keypoints_template[match.queryIdx]
+        kp_to = keypoints_image[match.trainIdx]
+
+        source_pt.append(kp_from.pt)
+        target_pt.append(kp_to.pt)
+
+    return numpy.array(source_pt, dtype=float), numpy.array(target_pt, dtype=float)
+
+
+def match_arrays(
+        points_template, points_image, query_idx, train_idx, distance, cluster_labels):
+    """
+    `match_points` on arrays: keep the best match of every cluster of
+    template keypoints, with a sort instead of a loop over match objects.
+    Gives the same points in the same order as `match_points`.
+
+    ## Arguments
+        + `points_template` - k by 2 matrix of template keypoint positions
+        + `points_image`    - l by 2 matrix of image keypoint positions
+        + `query_idx`       - m vector, template keypoint of every match
+        + `train_idx`       - m vector, image keypoint of every match
+        + `distance`        - m vector, descriptor distance of every match
+        + `cluster_labels`  - k vector, cluster of every template keypoint
+
+    ## Returns
+        + p by 2 matrix of the matched template keypoint positions
+        + p by 2 matrix of the matched image keypoint positions
+    """
+    query_idx = numpy.asarray(query_idx, dtype=numpy.intp).reshape(-1)
+    train_idx = numpy.asarray(train_idx, dtype=numpy.intp).reshape(-1)
+    distance = numpy.asarray(distance).reshape(-1)
+    labels = numpy.asarray(cluster_labels)[query_idx]
+
+    # by cluster, then distance; lexsort is stable so ties keep the match
+    # order, like `min` does
+    order = numpy.lexsort((distance, labels))
+    labels = labels[order]
+
+    first = numpy.ones(order.shape, dtype=bool)
+    first[1:] = labels[1:] != labels[:-1]
+    best = order[first]
+
+    source_pt = numpy.asarray(points_template, dtype=float)[query_idx[best]]
+    target_pt = numpy.asarray(points_image, dtype=float)[train_idx[best]]
+    return source_pt.reshape(-1, 2), target_pt.reshape(-1, 2)
+
+
+def _cluster_means(labels, source_pt, target_pt):
+    """
+    *assistant func* mean source and target point of every cluster
+    """
+    _, labels = numpy.unique(labels, return_inverse=True)
+    labels = labels.reshape(-1)
+    counts = numpy.bincount(labels)[:, None]
+
+    def mean(points):
+        return numpy.stack([
+            numpy.bincount(labels, weights=points[:, k]) for k in range(points.shape[1])
+        ], axis=1) / counts
+
+    return mean(source_pt), mean(target_pt)
+
+
+def _grid_labels(points, n) -> numpy.ndarray:
+    """
+    *assistant func* cell of every point on a square grid over the bounding
+    box of `points` with about `n` occupied cells
+    """
+    lower = numpy.min(points, axis=0)
+    extent = numpy.max(points, axis=0) - lower
+
+    area = numpy.prod(extent[extent > 0])
+    dims = numpy.count_nonzero(extent > 0)
+    if dims == 0:
+        return numpy.zeros(points.shape[0], dtype=numpy.intp)
+    cell = (area / n) **(1 / dims)
+
+    # the bounding box is rarely filled: grow the cells towards n occupied
+    best = None
+    for _ in range(8):
+        index = numpy.floor((points - lower) / cell).astype(numpy.intp)
+        shape = numpy.max(index, axis=0) +1
+        labels = numpy.ravel_multi_index(index.T, shape)
+        occupied = numpy.unique(labels).size
+
+        if occupied <= n and (best is None or occupied > best[0]):
+            best = occupied, labels
+        if n *.9 <= occupied <= n:
+            break
+        cell *= (occupied / n) **(1 / dims)
+
+    if best is None:
+        best = occupied, labels
+    return best[1]
+
+
+def reduce_matches(source_pt, target_pt, n, method='grid', random_state=0):
+    """
+    Reduce matched points to about `n` control points, each the mean of a
+    cluster of matches; averaging also evens out the noise of the matches.
+
+    ## Arguments
+        + `source_pt`, `target_pt` - p by 2 matrices of matched points
+        + `n`            - the number of control points to keep
+        + `method`       - `grid` bins the template points on a uniform grid,
+                           O(p); `kmeans` clusters them with scikit-learn's
+                           `MiniBatchKMeans`, slower but adapts to the density
+        + `random_state` - seed of `kmeans`
+
+    ## Returns
+        + at most n by 2 matrix of template control points
+        + the matching image points
+    """
+    source_pt = numpy.asarray(source_pt, dtype=float)
+    target_pt = numpy.asarray(target_pt, dtype=float)
+    if source_pt.shape[0] <= n:
+        return source_pt, target_pt
+
+    if method == 'grid':
+        labels = _grid_labels(source_pt, n)
+    elif method == 'kmeans':
+        from sklearn.cluster import MiniBatchKMeans
+        kmeans = MiniBatchKMeans(
+            n_clusters=n,
+            batch_size=max(1024, 4 *n),
+            n_init=1,
+            random_state=random_state
+        )
+        labels = kmeans.fit_predict(source_pt)
+    else:
+        raise ValueError(f'Unknown reduction method `{method}`.')
+
+    return _cluster_means(labels, source_pt, target_pt)
+
+
 class TpsWarp(Embdding):
     """
     The projection form 2d parameterization plane to 2d image
@@ -16,28 +171,108 @@ class TpsWarp(Embdding):
         keypoints_template  :numpy.ndarray,
         keypoints_image     :numpy.ndarray,
         matches             :numpy.ndarray,
-        cluster_labels      :numpy.ndarray
+        cluster_labels      :numpy.ndarray = None,
+        control_points      :int = None,
+        reduce              :str = 'grid',
+        random_state        = 0,
+        alpha               = 0
     ):
-        matches = sorted(matches, key=lambda m: cluster_labels[m.queryIdx])
+        """
+        ## Arguments
+            + `keypoints_template`, `keypoints_image` - keypoints with a `pt`
+                                                    position
+            + `matches`        - matches with `queryIdx`, `trainIdx` and
+                                 `distance`
+            + `cluster_labels` - cluster of every template keypoint; only the
+                                 best match of a cluster is kept. Defaults to
+                                 every keypoint on its own.
+            + `control_points` - reduce the kept matches to about this many
+                                 control points before fitting, see
+                                 `reduce_matches`; the fit is cubic in their
+                                 number. `match_error` tells what it costs.
+            + `reduce`, `random_state` - see `reduce_matches`
+            + `alpha`          - regularization of the TPS, a value or
+                                 `'gcv'` / `'loo'` to select it, see `TPS`
+        """
+        if cluster_labels is None:
+            cluster_labels = numpy.arange(len(keypoints_template))
+
+        source_pt, target_pt = match_points(
+            keypoints_template, keypoints_image, matches, cluster_labels)
+        self._fit(source_pt, target_pt, control_points, reduce, random_state, alpha)
 
-        source_pt = []
-        target_pt = []
-        for _, cluster in groupby(matches, lambda m: cluster_labels[m.queryIdx]):
-            cluster = list(cluster)
+    def _fit(self, source_pt, target_pt, control_points, reduce, random_state, alpha=0):
+        """
+        *assistant func* reduce the matches if asked and solve thin plate
+        spline
+        """
+        self._matches = source_pt, target_pt
+        if control_points is not None:
+            source_pt, target_pt = reduce_matches(
+                source_pt, target_pt, control_points, reduce, random_state)
 
-            if len(cluster) == 1:
-                match = cluster[0]
-            else:
-                match = min(cluster, key=lambda m: m.distance)
+        self._tps = TPS(source_pt, target_pt, alpha=alpha)
 
-            kp_from = keypoints_template[match.queryIdx]
-            kp_to = keypoints_image[match.trainIdx]
+    @classmethod
+    def from_arrays(
+        cls,
+        points_template :numpy.ndarray,
+        points_image    :numpy.ndarray,
+        query_idx       :numpy.ndarray,
+        train_idx       :numpy.ndarray,
+        distance        :numpy.ndarray,
+        cluster_labels  :numpy.ndarray = None,
+        control_points  :int = None,
+        reduce          :str = 'grid',
+        random_state    = 0,
+        alpha           = 0
+    ) -> 'TpsWarp':
+        """
+        Build the warp from matches given as arrays, see `match_arrays`;
+        same result as the constructor on the equivalent match objects.
+        """
+        if cluster_labels is None:
+            cluster_labels = numpy.arange(len(points_template))
 
-            source_pt.append(kp_from.pt)
-            target_pt.append(kp_to.pt)
+        source_pt, target_pt = match_arrays(
+            points_template, points_image, query_idx, train_idx, distance, cluster_labels)
 
-        # solve thin plane spline
-        self._tps = TPS(source_pt, target_pt)
+        self = cls.__new__(cls)
+        self._fit(source_pt, target_pt, control_points, reduce, random_state, alpha)
+        return self
+
+    @classmethod
+    def from_tps(cls, tps) -> 'TpsWarp':
+        """
+        Wrap an already fitted `tps` without recomputing it.
+        """
+        self = cls.__new__(cls)
+        self._tps = tps
+        self._matches = None
+        return self
+
+    def match_error(self):
+        """
+        Distance between the warped and the matched image point over all
+        kept matches, before any reduction.
+
+        ## Returns
+            + the root mean square distance
+            + the largest distance
+        """
+        if self._matches is None:
+            raise ValueError('The matches of this warp are unknown.')
+
+        source_pt, target_pt = self._matches
+        dist = numpy.linalg.norm(self._tps(source_pt) - target_pt, axis=1)
+        return float(numpy.sqrt(numpy.mean(dist **2))), float(numpy.max(dist, initial=0))
+
+    @property
+    def tps(self) -> TPS:
+        return self._tps
 
     def __call__(self, pt) -> numpy.ndarray:
         return self._tps(pt)
+
+    def jacobian(self, pt) -> numpy.ndarray:
+        return self._tps.jacobian(pt)
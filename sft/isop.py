@@ -5,40 +5,146 @@ implement IsoPSfT algorithm
 """
 import numpy
 
-from .embedding import Embdding, TPS
+from .embedding import Embdding, EvaluationPlan, TPS
+from .stats import stage
 
 
-def _1xNpoint(point):
+def _Nxdarray(data, n):
     """
-    *assistant func* ensure point datatype and shape
+    *assistant func* ensure a batch of points is a n by d array
     """
-    return numpy.array(point, dtype=float).reshape(-1)
+    return numpy.array(data, dtype=float).reshape(n, -1)
 
 
-def _Nx1point(point):
+def differentiate_batch(func, points):
     """
-    *assistant func* ensure point datatype and shape
+    *assistant func* get gradients on specific function at every row of
+    `points` at once by a forward difference of unit step
+
+    ## Returns
+        n by m by d array, where m is the output dimension of `func` and d is
+        the dimension of `points`
+    """
+    n, d = points.shape
+
+    # evaluate original and every shifted point set in a single call
+    shifted = numpy.tile(points, (d+1, 1, 1))
+    for i in range(d):
+        shifted[i+1, :, i] += 1
+
+    values = _Nxdarray(func(shifted.reshape(-1, d)), n *(d+1))
+    values = values.reshape(d+1, n, -1)
+
+    gradient = values[1:] - values[0][None]
+    return gradient.transpose(1, 2, 0)
+
+
+def jacobian(func, points):
+    """
+    *assistant func* get gradients on specific function at every row of
+    `points`; use the closed form from `func.jacobian` when the embedding
+    provides one and fall back to `differentiate_batch` for plain functions
+    and when it raises `NotImplementedError`
+    """
+    closed_form = getattr(func, 'jacobian', None)
+    if closed_form is None:
+        return differentiate_batch(func, points)
+
+    try:
+        deriv = closed_form(points)
+    except NotImplementedError:
+        return differentiate_batch(func, points)
+    return _Nxdarray(deriv, points.shape[0]).reshape(points.shape[0], -1, points.shape[1])
+
+
+def min_eigenvalue_2x2(K, G, det_G):
     """
-    return numpy.array(point, dtype=float).reshape(-1, 1)
+    *assistant func* smallest eigenvalue of K*inv(G) for a stack of 2 by 2
+    matrices, in closed form
 
+    ## Arguments
+        + `K` - n by 2 by 2 array
+        + `G` - n by 2 by 2 array, non-singular
+        + `det_G` - determinant of every matrix in `G`
+    """
+    # K * adj(G); inv(G) = adj(G) / det(G)
+    KadjG_tr = K[:, 0, 0] *G[:, 1, 1] - K[:, 0, 1] *G[:, 1, 0] \
+             - K[:, 1, 0] *G[:, 0, 1] + K[:, 1, 1] *G[:, 0, 0]
+    det_K = K[:, 0, 0] *K[:, 1, 1] - K[:, 0, 1] *K[:, 1, 0]
+
+    tr = KadjG_tr / det_G
+    det = det_K / det_G
+
+    # K and G are symmetric semi-definite so the roots are real; clamp the
+    # discriminant against rounding error
+    disc = numpy.maximum(tr **2 /4 - det, 0)
+    return tr /2 - numpy.sqrt(disc)
+
+
+def template_terms(template_embedding, control_points, stats=None):
+    """
+    *assistant func* the warp independent part of IsoPSfT: the template
+    points P and the matrices K = dP^T * dP at every control point
+    """
+    p = control_points.shape[0]
+
+    with stage(stats, 'derivatives'):
+        P = _Nxdarray(template_embedding(control_points), p)
+        deriv_P = jacobian(template_embedding, control_points)
+
+    # matrix K
+    with stage(stats, 'assembly'):
+        K = numpy.einsum('nki,nkj->nij', deriv_P, deriv_P)
 
-def differentiate(func, pt):
+    return P, K
+
+
+def depth_targets(warp, control_points, K, stats=None):
     """
-    *assistant func* get gradient on specific function at specific point
+    *assistant func* the warp dependent part of IsoPSfT
+
+    ## Returns
+        + mask of the control points kept; the others have a singular G or no
+          finite eigenvalue
+        + m by 3 matrix of their template space targets, m = sum(mask)
     """
-    original_point = _1xNpoint(func(pt))
+    p = control_points.shape[0]
 
-    gradient = numpy.empty((original_point.size, pt.size))
-    for i, _ in enumerate(pt):
-        pd = pt.copy()
-        pd[i] += 1
+    # image space
+    with stage(stats, 'derivatives'):
+        q = _Nxdarray(warp(control_points), p)
+        deriv_q = jacobian(warp, control_points)
 
-        new_point = _1xNpoint(func(pd))
-        diff = new_point - original_point
+    with stage(stats, 'assembly'):
+        qt = numpy.hstack([q, numpy.ones((p, 1))])
+        qt_norm2 = numpy.sum(qt **2, axis=1)
 
-        gradient[:, i] = diff
+        # matrix G
+        deriv_qTq = numpy.einsum('nki,nk->ni', deriv_q, q)
+        G_pos = numpy.einsum('nki,nkj->nij', deriv_q, deriv_q)
+        G_post = deriv_qTq[:, :, None] *deriv_qTq[:, None, :]
+        G = G_pos - G_post / qt_norm2[:, None, None]
 
-    return gradient
+    # lambda
+    with stage(stats, 'eigen'):
+        det_G = G[:, 0, 0] *G[:, 1, 1] - G[:, 0, 1] *G[:, 1, 0]
+
+        # drop singular; relative to the scale of G, which follows the units
+        # of the image (pixels or normalized coordinates)
+        half_tr = (G[:, 0, 0] + G[:, 1, 1]) / 2
+        valid = numpy.abs(det_G) > 1E-6 *half_tr **2
+
+        lambda2 = min_eigenvalue_2x2(K[valid], G[valid], det_G[valid])
+
+        finite = numpy.isfinite(lambda2)
+        valid[valid] = finite
+
+    if stats is not None:
+        stats.count('control_points', p)
+        stats.count('skipped_singular', p - finite.size)
+        stats.count('skipped_eigen', finite.size - numpy.count_nonzero(finite))
+
+    return valid, qt[valid] *lambda2[finite, None]
 
 
 class IsoPSfT(Embdding):
@@ -46,11 +152,15 @@ class IsoPSfT(Embdding):
     The isometric perspective shape-from-template embedding
     """
 
+    stats = None
+
     def __init__(
         self,
         warp                :Embdding,
         template_embedding  :Embdding,
-        control_points      :numpy.ndarray
+        control_points      :numpy.ndarray,
+        stats               = None,
+        alpha               = 0
     ):
         """
         ## Arguments
@@ -60,6 +170,10 @@ class IsoPSfT(Embdding):
                                    template space
             + `control_points` - n by 2 matrix of points set on parameterization
                                space
+            + `stats` - optional `sft.Stats` collecting per stage timings and
+                      the number of control points skipped by reason
+            + `alpha` - regularization of the template space TPS, a value or
+                      `'gcv'` / `'loo'` to select it, see `TPS`
         """
         if not isinstance(warp, Embdding):
             raise TypeError('`warp` is not a Embedding instance.')
@@ -71,45 +185,73 @@ class IsoPSfT(Embdding):
             f'Dimension of `control_points` (d={control_points.shape[1]})' \
              ' does not match requirements (d=2).'
 
-        # calculate
-        source_points = []
-        target_points = []
-        for point in control_points:
-            # image space
-            q = _Nx1point(warp(point))
-            qt = _Nx1point((*q, 1))
-            qt_norm = numpy.linalg.norm(qt)
+        P, K = template_terms(template_embedding, control_points, stats)
+        valid, target_points = depth_targets(warp, control_points, K, stats)
+        source_points = P[valid]
 
-            deriv_q = differentiate(warp, point)
-
-            # template space
-            P = template_embedding(point)
-            deriv_P = differentiate(template_embedding, point)
+        self.tps = TPS(source_points, target_points, alpha=alpha, stats=stats)
+        self.template_embedding = template_embedding
+        self.stats = stats
 
-            # matrix K
-            K = numpy.dot(deriv_P.T, deriv_P)
+    @classmethod
+    def from_tps(cls, tps, template_embedding) -> 'IsoPSfT':
+        """
+        Wrap an already fitted template space `tps` without recomputing it.
+        """
+        self = cls.__new__(cls)
+        self.tps = tps
+        self.template_embedding = template_embedding
+        self.stats = tps.stats
+        return self
 
-            # matrix G
-            G_pos = numpy.dot(deriv_q.T, deriv_q)
-            G_post = numpy.dot(numpy.dot(numpy.dot(deriv_q.T, q), q.T), deriv_q)
-            G = G_pos - G_post / (qt_norm **2)
+    def __call__(
+        self,
+        points,
+        block_size  :int = None,
+        max_bytes   :int = None,
+        out         :numpy.ndarray = None,
+        workers     :int = None,
+        executor    = 'thread'
+    ) -> numpy.ndarray:
+        """
+        ## Arguments
+            + `points` - n by 2 matrix of points on parameterization space
+            + `block_size`, `max_bytes`, `out`, `workers`, `executor` - see
+              `TPS.__call__`
+        """
+        points = numpy.array(points, dtype=float)
+        return self.tps(
+            self.template_embedding(points),
+            block_size=block_size,
+            max_bytes=max_bytes,
+            out=out,
+            workers=workers,
+            executor=executor
+        )
 
-            # lambda
-            if numpy.abs(numpy.linalg.det(G)) < 1E-6: # singular
-                continue
+    def iter_evaluate(self, points, block_size=None, max_bytes=None):
+        """
+        Generator version of `__call__`, see `TPS.iter_evaluate`
+        """
+        points = numpy.array(points, dtype=float)
+        return self.tps.iter_evaluate(
+            self.template_embedding(points),
+            block_size=block_size,
+            max_bytes=max_bytes
+        )
 
-            try:
-                KG = numpy.dot(K, numpy.linalg.inv(G))
-                lambda2 = numpy.min(numpy.linalg.eig(KG)[0])
-            except numpy.linalg.LinAlgError:
-                continue
+    def plan(self, points) -> EvaluationPlan:
+        """
+        An `EvaluationPlan` of this model on `points` of parameterization
+        space; the template embedding is applied once, here.
+        """
+        points = numpy.array(points, dtype=float)
+        return EvaluationPlan(self.template_embedding(points), self.tps.source_points)
 
-            source_points.append(P)
-            target_points.append(qt.reshape(-1) *lambda2)
+    def jacobian(self, points) -> numpy.ndarray:
+        points = numpy.array(points, dtype=float).reshape(-1, 2)
 
-        self.tps = TPS(source_points, target_points)
-        self.template_embedding = template_embedding
+        deriv_tps = self.tps.jacobian(self.template_embedding(points))
+        deriv_template = jacobian(self.template_embedding, points)
 
-    def __call__(self, points) -> numpy.ndarray:
-        points = numpy.array(points, dtype=float)
-        return self.tps(self.template_embedding(points))
+        return numpy.einsum('nij,njk->nik', deriv_tps, deriv_template)
@@ -0,0 +1,139 @@
+"""
+sequence.py
+
+reconstruct a video with IsoPSfT, reusing work from frame to frame
+"""
+import numpy
+
+from .embedding import Embdding, EvaluationPlan, TPS, TpsWarp
+from .embedding.tps_warp import match_arrays, match_points
+from .isop import IsoPSfT, template_terms, depth_targets
+from .stats import stage
+
+
+class IsoPSfTSequence:
+    """
+    One IsoPSfT reconstruction per frame of a sequence sharing the template
+    and its control points.
+
+    Across frames it reuses
+        + the template points and K matrices of the control points,
+        + the factorization of the warp TPS when the matched template
+          keypoints did not change,
+        + the factorization of the template TPS when the same control points
+          were valid in the previous frame,
+        + the radial basis of the query points for that template TPS.
+    Reused factorizations give the same results as fitting from scratch.
+    """
+
+    def __init__(
+        self,
+        template_embedding  :Embdding,
+        control_points      :numpy.ndarray,
+        query_points        :numpy.ndarray = None,
+        stats               = None
+    ):
+        """
+        ## Arguments
+            + `template_embedding` - the embedding from parameterization space to
+                                   template space
+            + `control_points` - n by 2 matrix of points set on parameterization
+                               space
+            + `query_points` - optional m by 2 matrix of points on
+                             parameterization space that every frame is
+                             evaluated on
+            + `stats` - optional `sft.Stats`; besides the IsoPSfT stages it
+                      counts `frames` and the reused factorizations
+        """
+        if not isinstance(template_embedding, Embdding):
+            raise TypeError('`template_embedding` is not a Embedding instance.')
+
+        control_points = numpy.array(control_points, dtype=float)
+        assert control_points.shape[1] == 2, \
+            f'Dimension of `control_points` (d={control_points.shape[1]})' \
+             ' does not match requirements (d=2).'
+
+        self.template_embedding = template_embedding
+        self.control_points = control_points
+        self.stats = stats
+        self.P, self.K = template_terms(template_embedding, control_points, stats)
+
+        self.plan = None
+        if query_points is not None:
+            query_points = numpy.array(query_points, dtype=float).reshape(-1, 2)
+            self.plan = EvaluationPlan(template_embedding(query_points))
+
+        self._warp_tps = None
+        self._tps = None
+        self._valid = None
+
+    def warp(self, frame) -> Embdding:
+        """
+        The warp of a frame; either the warp itself, a tuple of
+        `(keypoints_template, keypoints_image, matches, cluster_labels)` as
+        taken by `TpsWarp`, or a tuple of `(points_template, points_image,
+        query_idx, train_idx, distance, cluster_labels)` as taken by
+        `TpsWarp.from_arrays`.
+        """
+        if isinstance(frame, Embdding):
+            return frame
+
+        if len(frame) == 6:
+            source, target = match_arrays(*frame)
+        else:
+            source, target = match_points(*frame)
+
+        last = self._warp_tps
+        if last is not None and numpy.array_equal(last.control_points, source):
+            tps = last.with_targets(target)
+            if self.stats is not None:
+                self.stats.count('reused_warp_factorization')
+        else:
+            tps = TPS(source, target, stats=self.stats)
+
+        self._warp_tps = tps
+        return TpsWarp.from_tps(tps)
+
+    def reconstruct(self, frame):
+        """
+        Reconstruct a single frame.
+
+        ## Returns
+            + the `IsoPSfT` of this frame
+            + its template points on `query_points`, or `None` when no query
+              points were given
+        """
+        if self.stats is not None:
+            self.stats.count('frames')
+
+        warp = self.warp(frame)
+        valid, target_points = depth_targets(warp, self.control_points, self.K, self.stats)
+
+        if self._tps is not None and numpy.array_equal(valid, self._valid):
+            tps = self._tps.with_targets(target_points)
+            if self.stats is not None:
+                self.stats.count('reused_tps_factorization')
+        else:
+            tps = TPS(self.P[valid], target_points, stats=self.stats)
+            self._valid = valid
+
+        self._tps = tps
+        model = IsoPSfT.from_tps(tps, self.template_embedding)
+
+        if self.plan is None:
+            return model, None
+
+        if not self.plan.matches(tps.source_points):
+            self.plan.compile(tps.source_points)
+
+        with stage(self.stats, 'evaluate'):
+            points = self.plan(tps)
+
+        return model, points
+
+    def __call__(self, frames):
+        """
+        Generator of `reconstruct` over `frames`.
+        """
+        for frame in frames:
+            yield self.reconstruct(frame)
@@ -0,0 +1,528 @@
+"""
+service.py
+
+local pool of long-lived worker processes serving evaluations of fitted
+models, with the point arrays passed through shared memory
+
+    with ModelPool({'sft': model}, workers=4, clients=2) as pool:
+        client = pool.clients[0]     # pass to a client process as argument
+        points = client.evaluate('sft', query_points)
+        client.report()
+
+Only small messages go through the queues: the client writes its query
+points into one of its shared memory slots, a worker evaluates them into the
+same slot. Workers load the models with `load_model`, so they share the
+pages of one memory mapped file.
+
+The shared memory of a client belongs to the process that first uses it:
+that process creates the blocks and unlinks them on `Client.close`, or at
+its exit when it does not call it. The workers only attach to them, without
+registering them with a resource tracker, and never unlink them.
+
+A client waiting for a response raises `RuntimeError` once a worker is gone,
+told by the process itself in the pool's process and by the heartbeats the
+workers write to shared memory elsewhere, and `TimeoutError` after the
+`timeout` of the pool. The pool should be closed after either.
+"""
+from collections import defaultdict, deque
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import numpy
+
+from .embedding import TpsWarp
+from .storage import load_model, save_model
+
+# multiprocessing is imported where it is used, like the scipy modules of
+# `sft.embedding.tps`.
+
+# seconds between two heartbeats of a worker, and without one until a client
+# takes the worker for dead
+HEARTBEAT_INTERVAL = .5
+HEARTBEAT_TIMEOUT = 10
+
+
+def _attach(name):
+    """
+    *assistant func* attach to an existing shared memory block without
+    registering it with a resource tracker, which would unlink it when this
+    process exits
+    """
+    from multiprocessing import resource_tracker, shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # python < 3.13
+        pass
+
+    # it registers every block it attaches to. Unregistering afterwards is
+    # no fix: a tracker shared with the owner, as under `spawn`, keeps one
+    # entry per name and would forget the owner's.
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _release(segments):
+    """
+    *assistant func* close and unlink the shared memory of a client
+    """
+    for shm in segments:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _slot_views(buf, n, d_in, d_out):
+    """
+    *assistant func* query and result arrays of a slot
+    """
+    points = numpy.ndarray((n, d_in), dtype=float, buffer=buf)
+    result = numpy.ndarray((n, d_out), dtype=float, buffer=buf, offset=n *d_in *8)
+    return points, result
+
+
+def _heartbeat(heartbeats, index, stop):
+    """
+    *assistant func* time stamp of a live worker, from a thread of its own so
+    that long evaluations do not hold it back
+    """
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        heartbeats[index] = time.time()
+
+
+def _worker(index, heartbeats, paths, trusted, requests, responses, max_batch):
+    """
+    *assistant func* worker loop; a request is
+    `(client, slot, shm_name, model, n, d_in, d_out)`, a response
+    `(slot, error, service_seconds, batch_size)`; `trusted` names the models
+    that may hold pickled embeddings
+    """
+    heartbeats[index] = time.time()
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(heartbeats, index, stop), daemon=True).start()
+    try:
+        _serve(paths, trusted, requests, responses, max_batch)
+    finally:
+        stop.set()
+        # stopped, for good
+        heartbeats[index] = 0
+
+
+def _serve(paths, trusted, requests, responses, max_batch):
+    """
+    *assistant func* see `_worker`
+    """
+    models = {}
+    for name, path in paths.items():
+        model = load_model(path, allow_pickle=name in trusted)
+        # a warp evaluates as its spline, which takes `out`
+        models[name] = model.tps if isinstance(model, TpsWarp) else model
+    segments = {}
+    slot_names = {}     # (client, slot) -> name of its segment
+
+    running = True
+    while running:
+        batch = [requests.get()]
+        while len(batch) < max_batch:
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+
+        if None in batch:
+            # one stop sentinel per worker; hand back the others drained here
+            running = False
+            for _ in range(batch.count(None) -1):
+                requests.put(None)
+            batch = [r for r in batch if r is not None]
+
+        groups = defaultdict(list)
+        for request in batch:
+            groups[request[3]].append(request)
+
+        for name, group in groups.items():
+            start = time.perf_counter()
+            error = None
+            views = []
+            try:
+                for client, slot, shm_name, _, n, d_in, d_out in group:
+                    if shm_name not in segments:
+                        # a client used from a new process has new segments;
+                        # let go of the old one, unlinked by its owner
+                        old = slot_names.get((client, slot))
+                        if old is not None:
+                            segments.pop(old).close()
+                        segments[shm_name] = _attach(shm_name)
+                        slot_names[client, slot] = shm_name
+                    views.append(_slot_views(segments[shm_name].buf, n, d_in, d_out))
+
+                model = models[name]
+                if len(views) == 1:
+                    points, result = views[0]
+                    model(points, out=result)
+                else:
+                    # one evaluation for the whole group
+                    result = model(numpy.vstack([v[0] for v in views]))
+                    offset = 0
+                    for _, out in views:
+                        out[:] = result[offset:offset +len(out)]
+                        offset += len(out)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            finally:
+                # views on the segments must be gone before closing them
+                views = points = result = out = None
+
+            elapsed = time.perf_counter() - start
+            for client, slot, *_ in group:
+                responses[client].put((slot, error, elapsed, len(group)))
+
+    for shm in segments.values():
+        shm.close()
+
+
+class ModelPool:
+    """
+    A pool of worker processes holding fitted `TPS`, `TpsWarp` or `IsoPSfT`
+    models, and the clients that send them query points.
+
+    The clients are created with the pool, before the workers start, and
+    are handed to client processes as `Process` arguments.
+    """
+
+    def __init__(
+        self,
+        models      :dict,
+        workers     :int = None,
+        clients     :int = 1,
+        slots       :int = 4,
+        capacity    :int = 1 << 16,
+        max_batch   :int = 16,
+        allow_pickle:bool = False,
+        timeout     :float = None
+    ):
+        """
+        ## Arguments
+            + `models`    - dict of name to a fitted model or to a file
+                            written by `save_model`
+            + `workers`   - number of worker processes; defaults to the CPU
+                            count
+            + `clients`   - number of clients
+            + `slots`     - shared memory slots, i.e. requests in flight,
+                            per client
+            + `capacity`  - points per slot; larger queries are split
+            + `max_batch` - queued requests a worker evaluates at once;
+                            requests on the same model share one evaluation
+            + `allow_pickle` - load pickled embeddings from the given files,
+                            see `load_model`; models passed as objects are
+                            saved by the pool and always trusted
+            + `timeout`   - seconds a client waits for a response before it
+                            raises `TimeoutError`; by default it waits as long
+                            as the workers are alive
+        """
+        import multiprocessing
+
+        self._tmpdir = None
+        paths = {}
+        trusted = set()
+        for name, model in models.items():
+            if isinstance(model, (str, os.PathLike)):
+                paths[name] = os.fspath(model)
+                if allow_pickle:
+                    trusted.add(name)
+                continue
+            trusted.add(name)
+            if self._tmpdir is None:
+                self._tmpdir = tempfile.TemporaryDirectory(prefix='sft-pool-')
+            paths[name] = os.path.join(self._tmpdir.name, f'{len(paths)}.sft')
+            save_model(model, paths[name])
+
+        dims = {}
+        for name, path in paths.items():
+            model = load_model(path, allow_pickle=name in trusted)
+            tps = getattr(model, 'tps', model)
+            d_in = 2 if tps is not model else tps.d
+            dims[name] = d_in, tps.coef.shape[1]
+
+        ctx = multiprocessing.get_context()
+        self._requests = ctx.Queue()
+        responses = [ctx.Queue() for _ in range(clients)]
+
+        workers = workers or os.cpu_count() or 1
+        heartbeats = ctx.Array('d', [time.time()] *workers, lock=False)
+
+        self.clients = [
+            Client(i, self._requests, responses[i], dims, slots, capacity, heartbeats, timeout)
+            for i in range(clients)
+        ]
+
+        self._workers = [
+            ctx.Process(
+                target=_worker,
+                args=(k, heartbeats, paths, trusted, self._requests, responses, max_batch),
+                daemon=True
+            )
+            for k in range(workers)
+        ]
+        for process in self._workers:
+            process.start()
+
+        # in this process the clients ask the processes themselves
+        for client in self.clients:
+            client._processes = self._workers
+            client._pool_pid = os.getpid()
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory of the clients
+        created in this process.
+        """
+        for _ in self._workers:
+            self._requests.put(None)
+        for process in self._workers:
+            process.join()
+        for client in self.clients:
+            client.close()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class Client:
+    """
+    Sends query points to the workers of a `ModelPool`. A client is used by
+    one process at a time; its shared memory is created in the process that
+    first uses it, which owns it: `close` there, or the exit of that
+    process, unlinks it.
+    """
+
+    # worker processes, usable in the process of the pool only
+    _processes = None
+    _pool_pid = None
+    _finalizer = None
+
+    def __init__(
+            self, index, requests, responses, dims, slots, capacity,
+            heartbeats, timeout=None):
+        self.index = index
+        self.dims = dims
+        self.capacity = capacity
+        self.timeout = timeout
+        self._requests = requests
+        self._responses = responses
+        self._heartbeats = heartbeats
+        self._n_slots = slots
+        self._segments = None
+        self._pid = None
+        self.reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_segments'] = None
+        state['_pid'] = None
+        state['_finalizer'] = None
+        # process handles only work in the process that started them
+        state.pop('_processes', None)
+        return state
+
+    def _check_workers(self):
+        """
+        *assistant func* raise `RuntimeError` when a worker is gone; a
+        request it took will never be answered
+        """
+        if self._processes is not None and os.getpid() == self._pool_pid:
+            dead = [k for k, process in enumerate(self._processes) if not process.is_alive()]
+        else:
+            now = time.time()
+            dead = [
+                k for k, beat in enumerate(self._heartbeats)
+                if now - beat > HEARTBEAT_TIMEOUT
+            ]
+        if dead:
+            raise RuntimeError(f'Worker {dead[0]} of the pool is not running.')
+
+    def _response(self):
+        """
+        *assistant func* next response, waiting while the workers are alive
+        and at most `timeout` seconds
+        """
+        start = time.perf_counter()
+        while True:
+            try:
+                return self._responses.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                pass
+            self._check_workers()
+            if self.timeout is not None and time.perf_counter() - start > self.timeout:
+                raise TimeoutError(f'No response from the pool in {self.timeout} s.')
+
+    def _slots(self):
+        """
+        *assistant func* the shared memory slots of this process
+        """
+        if self._pid != os.getpid():
+            from multiprocessing import shared_memory, util
+
+            width = max(d_in +d_out for d_in, d_out in self.dims.values())
+            self._segments = [
+                shared_memory.SharedMemory(create=True, size=self.capacity *width *8)
+                for _ in range(self._n_slots)
+            ]
+            self._pid = os.getpid()
+
+            # released at the exit of this process unless `close` was called;
+            # also at the end of a `multiprocessing` child, which skips atexit
+            self._finalizer = util.Finalize(
+                self, _release, args=(self._segments,), exitpriority=10)
+        return self._segments
+
+    def reset(self):
+        """
+        Clear the numbers of `report`.
+        """
+        self.latencies = []
+        self.service_times = []
+        self.batch_sizes = []
+        self.n_points = 0
+        self.elapsed = 0.
+
+    def evaluate(self, name, points) -> numpy.ndarray:
+        """
+        Evaluate model `name` on `points`, which are split over the slots
+        when larger than `capacity`.
+        """
+        return next(self.map(name, [points]))
+
+    def map(self, name, batches):
+        """
+        Generator of the evaluations of model `name` on every array of
+        `batches`, in order, with up to `slots` requests in flight.
+        """
+        if name not in self.dims:
+            raise KeyError(f'No model named `{name}` in the pool.')
+        d_in, d_out = self.dims[name]
+
+        segments = self._slots()
+        free = list(range(len(segments)))
+        pending = {}        # slot -> (submit time, entry, row offset, rows)
+        order = deque()     # [result, chunks left, points] in submission order
+        errors = []
+        broken = []         # the pool stopped answering; nothing to drain
+
+        def wait():
+            try:
+                slot, error, service, batch_size = self._response()
+            except (RuntimeError, TimeoutError):
+                broken.append(True)
+                raise
+            submitted, entry, offset, n = pending.pop(slot)
+            self.latencies.append(time.perf_counter() - submitted)
+            self.service_times.append(service)
+            self.batch_sizes.append(batch_size)
+
+            if error is None:
+                _, out = _slot_views(segments[slot].buf, n, d_in, d_out)
+                entry[0][offset:offset +n] = out
+                del out
+            else:
+                errors.append(error)
+            entry[1] -= 1
+            free.append(slot)
+
+        def completed():
+            if errors:
+                while pending:
+                    wait()
+                raise RuntimeError(f'Worker failed on `{name}`: {errors[0]}')
+            while order and order[0][1] == 0:
+                result, _, n = order.popleft()
+                self.n_points += n
+                yield result
+
+        start = time.perf_counter()
+        try:
+            for points in batches:
+                points = numpy.asarray(points, dtype=float)
+                if points.ndim == 0 or points.shape[-1] != d_in:
+                    raise ValueError(
+                        f'Points of `{name}` have {d_in} coordinates, got an array'
+                        f' of shape {points.shape}.')
+                points = points.reshape(-1, d_in)
+                entry = [numpy.empty((points.shape[0], d_out)), 0, points.shape[0]]
+                order.append(entry)
+
+                for offset in range(0, points.shape[0], self.capacity):
+                    while not free:
+                        wait()
+                    slot = free.pop()
+                    chunk = points[offset:offset +self.capacity]
+
+                    view, _ = _slot_views(segments[slot].buf, len(chunk), d_in, d_out)
+                    view[:] = chunk
+                    del view
+
+                    entry[1] += 1
+                    pending[slot] = time.perf_counter(), entry, offset, len(chunk)
+                    self._requests.put(
+                        (self.index, slot, segments[slot].name, name, len(chunk), d_in, d_out))
+
+                yield from completed()
+
+            while pending:
+                wait()
+            yield from completed()
+        finally:
+            # an abandoned generator must not leave responses behind
+            while pending and not broken:
+                wait()
+            self.elapsed += time.perf_counter() - start
+
+    def report(self) -> dict:
+        """
+        Throughput and latency of the requests of this client since the
+        last `reset`; latencies in seconds.
+        """
+        latencies = numpy.array(self.latencies)
+        if latencies.size == 0:
+            return {'requests': 0, 'points': 0}
+        return {
+            'requests': latencies.size,
+            'points': self.n_points,
+            'points_per_second': self.n_points / self.elapsed if self.elapsed else numpy.inf,
+            'requests_per_second': latencies.size / self.elapsed if self.elapsed else numpy.inf,
+            'latency_mean': float(numpy.mean(latencies)),
+            'latency_p50': float(numpy.percentile(latencies, 50)),
+            'latency_p95': float(numpy.percentile(latencies, 95)),
+            'latency_p99': float(numpy.percentile(latencies, 99)),
+            'service_mean': float(numpy.mean(self.service_times)),
+            'batch_mean': float(numpy.mean(self.batch_sizes)),
+        }
+
+    def close(self):
+        """
+        Release the shared memory this process created for this client; a
+        client process should call it before it exits, the pool calls it for
+        its own process. The client stays usable and creates new blocks.
+        """
+        if self._finalizer is not None and self._pid == os.getpid():
+            # runs `_release` once
+            self._finalizer()
+        self._finalizer = None
+        self._segments = None
+        self._pid = None
@@ -0,0 +1,95 @@
+"""
+stats.py
+
+timing and diagnostics collected while fitting and evaluating
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import time
+
+
+class Stats:
+    """
+    Collector passed as `stats=` to `TPS`, `IsoPSfT` and `IsoPSfTSequence`.
+
+    + `durations` - seconds spent per stage, summed over calls
+    + `calls`     - number of times every stage ran
+    + `counts`    - event counters, e.g. control points skipped by reason
+    + `info`      - last reported value of sizes and condition estimates
+
+    Stages are `derivatives`, `assembly`, `eigen`, `tps_fit` and `evaluate`.
+    """
+
+    def __init__(self, callback=None):
+        """
+        ## Arguments
+            + `callback` - optional `callback(stage, seconds)` invoked after
+                           every stage
+        """
+        self.callback = callback
+        self.durations = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counts = defaultdict(int)
+        self.info = {}
+
+    @contextmanager
+    def _stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.durations[name] += elapsed
+            self.calls[name] += 1
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+    def count(self, name, value=1):
+        self.counts[name] += int(value)
+
+    def record(self, name, value):
+        self.info[name] = value
+
+    def reset(self):
+        self.durations.clear()
+        self.calls.clear()
+        self.counts.clear()
+        self.info.clear()
+
+    def as_dict(self) -> dict:
+        return {
+            'durations': dict(self.durations),
+            'calls': dict(self.calls),
+            'counts': dict(self.counts),
+            'info': dict(self.info),
+        }
+
+    def __repr__(self):
+        stages = ', '.join(f'{k}={v *1E3:.2f}ms' for k, v in self.durations.items())
+        return f'Stats({stages})'
+
+
+class _NullStage:
+    """
+    *assistant func* do-nothing context manager, shared by every disabled
+    stage
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(stats, name):
+    """
+    *assistant func* time the enclosed block as stage `name` when `stats` is
+    set; costs a single call otherwise
+    """
+    if stats is None:
+        return _NULL_STAGE
+    return stats._stage(name)
@@ -0,0 +1,205 @@
+"""
+storage.py
+
+versioned on-disk format of fitted models that loads by memory mapping
+
+The file is
+    + 8 bytes magic `SFTMODEL`
+    + uint32 format version and uint32 length of the header, little endian
+    + the header: utf-8 JSON with the model tree and the array table
+    + every array uncompressed, little endian, C order, each starting at a
+      multiple of `ALIGN` bytes; the header offsets count from the first
+      aligned byte after the header
+
+Loaded arrays are read-only views on one shared mapping of the file, so
+processes loading the same file share its pages and nothing is refitted.
+"""
+import json
+import math
+import mmap
+import pickle
+import struct
+
+import numpy
+
+from .embedding import Embdding, IdentityEmbdding, TPS, TpsWarp
+from .isop import IsoPSfT
+
+
+MAGIC = b'SFTMODEL'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+_PREFIX = struct.Struct('<8sII')
+
+
+def _align(offset) -> int:
+    return -(-offset // ALIGN) *ALIGN
+
+
+class _Writer:
+    """
+    *assistant func* collect the arrays of a model tree
+    """
+
+    def __init__(self):
+        self.arrays = []
+
+    def add(self, array) -> int:
+        array = numpy.asarray(array)
+        self.arrays.append(numpy.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')))
+        return len(self.arrays) -1
+
+    def node(self, model) -> dict:
+        if isinstance(model, IsoPSfT):
+            return {
+                'type': 'IsoPSfT',
+                'tps': self.node(model.tps),
+                'template_embedding': self.node(model.template_embedding),
+            }
+
+        if isinstance(model, TpsWarp):
+            return {'type': 'TpsWarp', 'tps': self.node(model.tps)}
+
+        if isinstance(model, TPS):
+            reduced = model._reduced
+            node = {
+                'type': 'TPS',
+                'd': model.d,
+                'alpha': float(model.alpha),
+                'residual': float(model.residual),
+                'reduced': reduced,
+                'source_points': self.add(model.source_points),
+                'coef': self.add(model.coef),
+                'affine': self.add(numpy.asarray(model._affine, dtype=numpy.int64)),
+            }
+            if reduced:
+                node['control_points'] = self.add(model.control_points)
+            return node
+
+        if type(model) is IdentityEmbdding:
+            return {'type': 'IdentityEmbdding'}
+
+        if isinstance(model, Embdding):
+            # any other embedding is kept as an opaque pickle
+            data = numpy.frombuffer(pickle.dumps(model), dtype=numpy.uint8)
+            return {'type': 'pickle', 'data': self.add(data)}
+
+        raise TypeError(f'Can not save a `{type(model).__name__}` instance.')
+
+
+def save_model(model, path):
+    """
+    Write a fitted `TPS`, `TpsWarp` or `IsoPSfT` to `path`.
+
+    The template embedding of an `IsoPSfT` is stored natively when it is an
+    `IdentityEmbdding`, `TPS` or `TpsWarp`, and pickled otherwise; such files
+    only load with `load_model(..., allow_pickle=True)`.
+    """
+    writer = _Writer()
+    tree = writer.node(model)
+
+    # offsets count from the first aligned byte after the header
+    table = []
+    offset = 0
+    for array in writer.arrays:
+        table.append({'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        offset = _align(offset +array.nbytes)
+
+    header = json.dumps({'model': tree, 'arrays': table}).encode()
+    start = _align(_PREFIX.size +len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for entry, array in zip(table, writer.arrays):
+            f.seek(start +entry['offset'])
+            f.write(array.data)
+        f.truncate(start +offset)
+
+
+def _build(node, arrays, allow_pickle=False):
+    """
+    *assistant func* model of a header tree node
+    """
+    kind = node['type']
+
+    if kind == 'IsoPSfT':
+        return IsoPSfT.from_tps(
+            _build(node['tps'], arrays, allow_pickle),
+            _build(node['template_embedding'], arrays, allow_pickle)
+        )
+
+    if kind == 'TpsWarp':
+        return TpsWarp.from_tps(_build(node['tps'], arrays, allow_pickle))
+
+    if kind == 'TPS':
+        tps = TPS.__new__(TPS)
+        tps.d = node['d']
+        tps.alpha = node['alpha']
+        tps.residual = node['residual']
+        tps.source_points = arrays[node['source_points']]
+        tps.coef = arrays[node['coef']]
+        tps.control_points = arrays[node.get('control_points', node['source_points'])]
+        tps._affine = arrays[node['affine']]
+        tps._reduced = node['reduced']
+        tps._factor = None
+        tps._basis = None
+        return tps
+
+    if kind == 'IdentityEmbdding':
+        return IdentityEmbdding()
+
+    if kind == 'pickle':
+        if not allow_pickle:
+            raise ValueError(
+                'The model holds a pickled embedding, which can run arbitrary'
+                ' code on loading; pass `allow_pickle=True` for trusted files only.')
+        return pickle.loads(arrays[node['data']].tobytes())
+
+    raise ValueError(f'Unknown model type `{kind}`.')
+
+
+def load_model(path, mmap_mode=True, allow_pickle=False):
+    """
+    Load a model written by `save_model`.
+
+    ## Arguments
+        + `path`         - file written by `save_model`
+        + `mmap_mode`    - map the file and view the arrays in place,
+                           read-only; with `False` the file is read into
+                           private memory
+        + `allow_pickle` - also load pickled embeddings. Unpickling runs
+                           whatever code the file asks for, so this is only
+                           safe on files you wrote yourself; without it those
+                           files raise `ValueError`.
+
+    The factorizations are not stored: `refit` and `with_targets` rebuild
+    them on first use.
+    """
+    with open(path, 'rb') as f:
+        if mmap_mode:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = bytearray(f.read())
+
+    magic, version, length = _PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f'`{path}` is not a sft model file.')
+    if version > FORMAT_VERSION:
+        raise ValueError(
+            f'`{path}` has format version {version}, this sft reads up to'
+            f' version {FORMAT_VERSION}.')
+
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size +length]))
+    start = _align(_PREFIX.size +length)
+
+    arrays = []
+    for entry in header['arrays']:
+        dtype = numpy.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        array = numpy.frombuffer(
+            buffer, dtype=dtype, count=math.prod(shape), offset=start +entry['offset'])
+        arrays.append(array.reshape(shape))
+
+    return _build(header['model'], arrays, allow_pickle)
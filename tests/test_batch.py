@@ -0,0 +1,27 @@
+"""
+seeding of the headless batch
+"""
+import numpy
+
+from demo.batch import DEFAULT_SEED, STATUS_OK, run_batch
+
+
+def test_default_runs_repeat():
+    configs = [{'xsamp': 8, 'ysamp': 8, 'nsamp': 20}, {'nsamp': 30, 'seed': 7}]
+    first = run_batch(configs, workers=1)
+    second = run_batch(configs, workers=1)
+
+    assert numpy.all(first['metrics']['status'] == STATUS_OK)
+    assert list(first['metrics']['seed']) == [DEFAULT_SEED, 7]
+    for i in range(len(configs)):
+        assert numpy.array_equal(first[f'solution_{i}'], second[f'solution_{i}'])
+
+
+def test_drawn_seed_is_recorded():
+    config = {'xsamp': 8, 'ysamp': 8, 'nsamp': 20, 'seed': None}
+    drawn = run_batch([config], workers=1)
+    seed = int(drawn['metrics']['seed'][0])
+
+    again = run_batch([dict(config, seed=seed)], workers=1)
+    assert numpy.array_equal(drawn['points_0'], again['points_0'])
+    assert numpy.array_equal(drawn['solution_0'], again['solution_0'])
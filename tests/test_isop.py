@@ -0,0 +1,178 @@
+"""
+`IsoPSfT` on a synthetic cylinder seen by a pinhole camera
+"""
+import numpy
+import pytest
+from scipy.linalg import eigh
+
+from sft import Embdding, IdentityEmbdding, IsoPSfT, TPS
+from sft.isop import depth_targets, differentiate_batch, jacobian, min_eigenvalue_2x2, template_terms
+
+
+FOCAL = 500
+
+
+@pytest.fixture(scope='module')
+def problem():
+    rng = numpy.random.RandomState(0)
+    x, y = rng.uniform(-20, 20, (2, 80))
+    z = .02 *x **2 + 60
+
+    # arc length along x, so the template is isometric to the surface
+    nx = .04 *x
+    u = (nx *numpy.sqrt(nx **2 +1) + numpy.arcsinh(nx)) / .08
+    param = numpy.stack([u, y], axis=1)
+    truth = numpy.stack([x, y, z], axis=1)
+    return param, truth[:, :2] / z[:, None], truth
+
+
+@pytest.mark.parametrize('scale', [1, FOCAL])
+def test_keeps_control_points_in_any_image_units(problem, scale):
+    param, normalized, _ = problem
+    warp = TPS(param, normalized *scale)
+
+    _, K = template_terms(IdentityEmbdding(), param)
+    valid, _ = depth_targets(warp, param, K)
+    assert valid.all()
+
+
+def test_reconstruction_up_to_scale(problem):
+    param, normalized, truth = problem
+    estimated = IsoPSfT(TPS(param, normalized), IdentityEmbdding(), param)(param)
+
+    scale = numpy.sum(estimated *truth) / numpy.sum(estimated **2)
+    error = numpy.linalg.norm(estimated *scale - truth, axis=1)
+    assert numpy.max(error) < .1 *numpy.max(numpy.linalg.norm(truth, axis=1))
+
+
+class _Quadratic(Embdding):
+    """
+    (x, y) -> (x^2, x*y) without a closed form derivative
+    """
+
+    def __call__(self, points):
+        return numpy.stack([points[:, 0] **2, points[:, 0] *points[:, 1]], axis=1)
+
+
+class _BrokenJacobian(_Quadratic):
+
+    def jacobian(self, points):
+        return self.missing
+
+
+def test_jacobian_falls_back_without_closed_form():
+    points = numpy.array([[1., 2.], [-3., .5]])
+    # forward difference of unit step
+    expected = numpy.array([
+        [[3., 0.], [2., 1.]],
+        [[-5., 0.], [.5, -3.]]
+    ])
+    assert numpy.allclose(jacobian(_Quadratic(), points), expected)
+    assert numpy.allclose(jacobian(_Quadratic().__call__, points), expected)
+
+
+def test_jacobian_does_not_hide_errors():
+    with pytest.raises(AttributeError):
+        jacobian(_BrokenJacobian(), numpy.ones((2, 2)))
+
+
+def _differentiate(func, point):
+    """
+    per-point forward difference of unit step, as IsoPSfT computed it
+    before the construction was vectorized
+    """
+    value = numpy.reshape(func(point[None]), -1)
+    gradient = numpy.empty((value.size, point.size))
+    for i in range(point.size):
+        shifted = point.copy()
+        shifted[i] += 1
+        gradient[:, i] = numpy.reshape(func(shifted[None]), -1) - value
+    return gradient
+
+
+def _depth_targets(warp, template_embedding, control_points):
+    """
+    per-point reference of `template_terms` and `depth_targets`
+    """
+    valid = []
+    targets = []
+    for point in control_points:
+        q = numpy.reshape(warp(point[None]), (-1, 1))
+        qt = numpy.vstack([q, [[1]]])
+        deriv_q = _differentiate(warp, point)
+        deriv_P = _differentiate(template_embedding, point)
+
+        K = numpy.dot(deriv_P.T, deriv_P)
+        G = numpy.dot(deriv_q.T, deriv_q) \
+          - numpy.dot(numpy.dot(numpy.dot(deriv_q.T, q), q.T), deriv_q) / numpy.sum(qt **2)
+
+        if abs(numpy.linalg.det(G)) <= 1E-6 *(numpy.trace(G) / 2) **2:
+            valid.append(False)
+            continue
+        lambda2 = numpy.min(numpy.linalg.eigvals(numpy.dot(K, numpy.linalg.inv(G))).real)
+        valid.append(True)
+        targets.append(qt.reshape(-1) *lambda2)
+    return numpy.array(valid), numpy.array(targets)
+
+
+def test_differentiate_batch_matches_per_point(problem):
+    param, _, _ = problem
+    func = _Quadratic()
+    expected = numpy.stack([_differentiate(func, point) for point in param])
+    assert numpy.allclose(differentiate_batch(func, param), expected, rtol=1E-12, atol=1E-9)
+
+
+def test_construction_matches_per_point(problem):
+    param, normalized, _ = problem
+    tps = TPS(param, normalized)
+
+    # a plain function, so that both take the same forward differences
+    def warp(points):
+        return tps(points)
+
+    # folded onto a line where x < 0, which makes G singular there
+    def folded_warp(points):
+        y = numpy.where(points[:, 0] < 0, .5 *points[:, 0], points[:, 1])
+        return numpy.stack([points[:, 0], y], axis=1) / 100
+
+    for func in (warp, folded_warp):
+        expected_valid, expected = _depth_targets(func, IdentityEmbdding(), param)
+        if func is folded_warp:
+            assert 0 < numpy.count_nonzero(expected_valid) < len(param)
+
+        _, K = template_terms(IdentityEmbdding(), param)
+        valid, targets = depth_targets(func, param, K)
+
+        assert numpy.array_equal(valid, expected_valid)
+        assert numpy.allclose(targets, expected.reshape(-1, 3), rtol=1E-9, atol=1E-12)
+
+
+def _spd(rng, n, near_singular):
+    """
+    n random symmetric positive semi-definite 2 by 2 matrices
+    """
+    A = rng.normal(size=(n, 2, 2))
+    if near_singular:
+        # rank one plus a tiny multiple of the identity
+        v = A[:, :, :1]
+        return v *v.transpose(0, 2, 1) \
+            + 10. **rng.uniform(-12, -6, (n, 1, 1)) *numpy.identity(2)
+    return numpy.matmul(A, A.transpose(0, 2, 1))
+
+
+@pytest.mark.parametrize('near_singular', [False, True])
+def test_min_eigenvalue_2x2(near_singular):
+    rng = numpy.random.RandomState(3)
+    K = _spd(rng, 500, near_singular)
+
+    # K * inv(I) is K itself
+    G = numpy.tile(numpy.identity(2), (500, 1, 1))
+    scale = numpy.max(numpy.abs(K), axis=(1, 2))
+    lam = min_eigenvalue_2x2(K, G, numpy.ones(500))
+    assert numpy.all(numpy.abs(lam - numpy.linalg.eigvalsh(K)[:, 0]) <= 1E-12 *scale)
+
+    # eigenvalues of K * inv(G) are those of the pencil (K, G)
+    G = _spd(rng, 500, False) + .1 *numpy.identity(2)
+    lam = min_eigenvalue_2x2(K, G, numpy.linalg.det(G))
+    expected = numpy.array([eigh(k, g, eigvals_only=True)[0] for k, g in zip(K, G)])
+    assert numpy.allclose(lam, expected, rtol=1E-9, atol=1E-9 *numpy.max(numpy.abs(expected)))
@@ -0,0 +1,55 @@
+"""
+`IsoPSfTSequence` against a fresh `IsoPSfT` per frame
+"""
+import numpy
+
+from sft import IdentityEmbdding, IsoPSfT, IsoPSfTSequence, Stats, TpsWarp
+
+
+def _frames():
+    """
+    matches of a bending cylinder seen by a pinhole camera; the last frame
+    loses some of the matches
+    """
+    rng = numpy.random.RandomState(0)
+    keypoints = rng.uniform(-20, 20, (60, 2))
+
+    frames = []
+    for i, bend in enumerate([.01, .015, .02, .025]):
+        x, y = keypoints.T
+        z = bend *x **2 + 60
+        image = numpy.stack([x, y], axis=1) / z[:, None]
+
+        matched = numpy.arange(len(keypoints))
+        if i == 3:
+            matched = matched[5:]
+        frames.append((
+            keypoints, image, matched, matched,
+            numpy.zeros(len(matched)), numpy.arange(len(keypoints))
+        ))
+    return frames
+
+
+def test_frames_equal_fresh_fits():
+    rng = numpy.random.RandomState(1)
+    control_points = rng.uniform(-15, 15, (40, 2))
+    query = rng.uniform(-15, 15, (200, 2))
+
+    stats = Stats()
+    sequence = IsoPSfTSequence(IdentityEmbdding(), control_points, query, stats=stats)
+
+    for frame in _frames():
+        model, points = sequence.reconstruct(frame)
+
+        fresh = IsoPSfT(TpsWarp.from_arrays(*frame), IdentityEmbdding(), control_points)
+        expected = fresh(query)
+        scale = numpy.max(numpy.abs(expected))
+
+        assert numpy.allclose(model.tps.source_points, fresh.tps.source_points)
+        assert numpy.allclose(model.tps.coef, fresh.tps.coef, rtol=1E-7, atol=1E-9 *scale)
+        assert numpy.allclose(model(query), expected, rtol=0, atol=1E-9 *scale)
+        assert numpy.allclose(points, expected, rtol=0, atol=1E-9 *scale)
+
+    # both the warm-started warp and the refitted template TPS were used
+    assert stats.counts['reused_warp_factorization'] == 2
+    assert stats.counts['reused_tps_factorization'] >= 2
@@ -0,0 +1,131 @@
+"""
+`ModelPool` serving a fitted spline, and its failures
+"""
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import numpy
+import pytest
+
+from sft import TPS, ModelPool
+from sft import service
+
+
+@pytest.fixture(scope='module')
+def tps():
+    rng = numpy.random.RandomState(0)
+    source = rng.uniform(size=(50, 2))
+    return TPS(source, source + .1 *rng.uniform(size=(50, 2)))
+
+
+def test_evaluate(tps):
+    query = numpy.random.RandomState(1).uniform(size=(1000, 2))
+    with ModelPool({'tps': tps}, workers=2, capacity=300) as pool:
+        assert numpy.allclose(pool.clients[0].evaluate('tps', query), tps(query))
+
+
+def test_wrong_dimension(tps):
+    with ModelPool({'tps': tps}, workers=1) as pool:
+        with pytest.raises(ValueError):
+            pool.clients[0].evaluate('tps', numpy.zeros((10, 3)))
+        # the client is still usable
+        assert pool.clients[0].evaluate('tps', numpy.zeros((1, 2))).shape == (1, 2)
+
+
+def test_dead_worker(tps):
+    with ModelPool({'tps': tps}, workers=1) as pool:
+        pool._workers[0].kill()
+        pool._workers[0].join()
+        with pytest.raises(RuntimeError):
+            pool.clients[0].evaluate('tps', numpy.zeros((10, 2)))
+
+
+def test_dead_worker_by_heartbeat(tps, monkeypatch):
+    monkeypatch.setattr(service, 'HEARTBEAT_TIMEOUT', 1)
+    with ModelPool({'tps': tps}, workers=1) as pool:
+        client = pool.clients[0]
+        # as in a client process, without the process handles
+        client._processes = None
+
+        pool._workers[0].kill()
+        start = time.perf_counter()
+        with pytest.raises(RuntimeError):
+            client.evaluate('tps', numpy.zeros((10, 2)))
+        assert time.perf_counter() - start < 5
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGSTOP'), reason='needs SIGSTOP')
+def test_timeout(tps):
+    with ModelPool({'tps': tps}, workers=1, timeout=1) as pool:
+        client = pool.clients[0]
+        client.evaluate('tps', numpy.zeros((1, 2)))
+
+        pid = pool._workers[0].pid
+        os.kill(pid, signal.SIGSTOP)
+        try:
+            with pytest.raises(TimeoutError):
+                client.evaluate('tps', numpy.zeros((10, 2)))
+        finally:
+            os.kill(pid, signal.SIGCONT)
+
+
+_SHUTDOWN = '''
+import multiprocessing, os, sys
+import numpy
+from sft import TPS, ModelPool
+
+def use(client, names, close):
+    assert client.evaluate('tps', numpy.ones((5, 2))).shape == (5, 2)
+    names.put([shm.name for shm in client._segments])
+    if close:
+        client.close()
+
+if __name__ == '__main__':
+    method, close = sys.argv[1], sys.argv[2] == '1'
+    ctx = multiprocessing.get_context(method)
+    multiprocessing.set_start_method(method)
+    source = numpy.random.RandomState(0).uniform(size=(30, 2))
+
+    names = []
+    with ModelPool({'tps': TPS(source, source)}, workers=2, slots=2) as pool:
+        pool.clients[0].evaluate('tps', numpy.ones((5, 2)))
+        names += [shm.name for shm in pool.clients[0]._segments]
+
+        # the same client from two processes in turn, with new segments each
+        queue = ctx.Queue()
+        for _ in range(2):
+            process = ctx.Process(target=use, args=(pool.clients[0], queue, close))
+            process.start()
+            names += queue.get(timeout=60)
+            process.join()
+            assert process.exitcode == 0
+
+    left = [name for name in names if os.path.exists('/dev/shm/' + name.lstrip('/'))]
+    print(len(names), left)
+'''
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='needs /dev/shm')
+@pytest.mark.parametrize('method', ['fork', 'spawn'])
+@pytest.mark.parametrize('close', [True, False])
+def test_clean_shutdown(tmp_path, method, close):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f'no `{method}` start method')
+
+    script = tmp_path / 'shutdown.py'
+    script.write_text(_SHUTDOWN)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    done = subprocess.run(
+        [sys.executable, str(script), method, str(int(close))],
+        capture_output=True, text=True, timeout=120,
+        env=dict(os.environ, PYTHONPATH=root))
+
+    # every segment unlinked by its owner, none left to the resource tracker
+    assert done.returncode == 0, done.stderr
+    assert done.stdout.split() == ['6', '[]']
+    assert 'leaked' not in done.stderr
+    assert 'Traceback' not in done.stderr
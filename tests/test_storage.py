@@ -0,0 +1,54 @@
+"""
+round trips of `save_model` / `load_model`
+"""
+import numpy
+import pytest
+
+from sft import Embdding, IdentityEmbdding, IsoPSfT, TPS, save_model, load_model
+
+
+class ScaledEmbedding(Embdding):
+    """
+    an embedding `save_model` has no native format for
+    """
+
+    def __call__(self, points) -> numpy.ndarray:
+        points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+        return numpy.hstack([2 *points, numpy.ones((points.shape[0], 1))])
+
+    def jacobian(self, points) -> numpy.ndarray:
+        points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+        deriv = numpy.array([[2, 0], [0, 2], [0, 0]], dtype=float)
+        return numpy.tile(deriv, (points.shape[0], 1, 1))
+
+
+def isopsft(template_embedding):
+    rng = numpy.random.RandomState(0)
+    param = rng.uniform(-10, 10, (40, 2))
+    image = param / (30 + param[:, :1] **2 *.05)
+    return IsoPSfT(TPS(param, image), template_embedding, param), param
+
+
+@pytest.mark.parametrize('mmap_mode', [True, False])
+def test_round_trip(tmp_path, mmap_mode):
+    model, param = isopsft(IdentityEmbdding())
+    save_model(model, tmp_path / 'model.sft')
+    loaded = load_model(tmp_path / 'model.sft', mmap_mode=mmap_mode)
+    assert numpy.allclose(loaded(param), model(param))
+
+
+def test_pickled_embedding_needs_opt_in(tmp_path):
+    model, param = isopsft(ScaledEmbedding())
+    save_model(model, tmp_path / 'model.sft')
+
+    with pytest.raises(ValueError):
+        load_model(tmp_path / 'model.sft')
+
+    loaded = load_model(tmp_path / 'model.sft', allow_pickle=True)
+    assert numpy.allclose(loaded(param), model(param))
+
+
+def test_not_a_model(tmp_path):
+    (tmp_path / 'model.sft').write_bytes(b'not a model file')
+    with pytest.raises(ValueError):
+        load_model(tmp_path / 'model.sft')
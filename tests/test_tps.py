@@ -0,0 +1,105 @@
+"""
+fits of `TPS` with coordinates constant over the control points
+"""
+import numpy
+import pytest
+
+from sft import TPS
+from sft.embedding.tps import pairwise_radial_basis
+
+
+@pytest.fixture
+def points():
+    rng = numpy.random.RandomState(0)
+    source = rng.uniform(-5, 5, (30, 2))
+    target = numpy.stack([
+        source[:, 0] + .1 *source[:, 1] **2,
+        source[:, 1] - .2 *numpy.sin(source[:, 0]),
+        source[:, 0] *source[:, 1] *.05
+    ], axis=1)
+    return source, target
+
+
+def test_general_position_matches_full_system(points):
+    source, target = points
+    source = numpy.hstack([source, numpy.linspace(0, 1, len(source))[:, None]])
+
+    # the textbook system with every affine term
+    p, d = source.shape
+    V = numpy.hstack([numpy.ones((p, 1)), source])
+    M = numpy.block([
+        [pairwise_radial_basis(source, source), V],
+        [V.T, numpy.zeros((d +1, d +1))]
+    ])
+    coef = numpy.linalg.solve(M, numpy.vstack([target, numpy.zeros((d +1, 3))]))
+
+    assert numpy.allclose(TPS(source, target).coef, coef)
+
+
+def test_constant_coordinate(points):
+    source, target = points
+    planar = numpy.hstack([source, numpy.ones((len(source), 1))])
+
+    tps = TPS(planar, target)
+    assert numpy.allclose(tps(planar), target)
+
+    # its affine term is zero and the spline on the plane is the 2d one
+    assert numpy.all(tps.coef[-1] == 0)
+    query = numpy.random.RandomState(1).uniform(-5, 5, (50, 2))
+    planar_query = numpy.hstack([query, numpy.ones((len(query), 1))])
+    warped = tps(planar_query)
+
+    # every output column is fitted on its own
+    assert numpy.allclose(warped[:, :2], TPS(source, target[:, :2])(query))
+    assert numpy.allclose(warped[:, 1:], TPS(source, target[:, 1:])(query))
+
+
+def test_collinear_points_stay_singular():
+    source = numpy.stack([numpy.arange(5.), 2 *numpy.arange(5.)], axis=1)
+    with pytest.raises(numpy.linalg.LinAlgError):
+        TPS(source, source)
+
+
+def test_no_points_is_singular():
+    with pytest.raises(numpy.linalg.LinAlgError):
+        TPS(numpy.zeros((0, 2)), numpy.zeros((0, 2)))
+
+
+@pytest.mark.parametrize('criterion', ['gcv', 'loo'])
+def test_alpha_selection_matches_refitting(criterion):
+    rng = numpy.random.RandomState(2)
+    source = rng.uniform(-5, 5, (20, 2))
+    target = numpy.stack([
+        numpy.sin(source[:, 0] / 2), source[:, 0] *source[:, 1] / 10
+    ], axis=1) + .2 *rng.normal(size=source.shape)
+    # noisy enough that neither end of the candidates wins
+    alphas = numpy.logspace(-2, 3, 6)
+
+    selected = TPS(source, target, alpha=criterion, alphas=alphas)
+
+    # the same scores from a fit per candidate, and per left out point
+    p = len(source)
+    scores = []
+    for alpha in alphas:
+        if criterion == 'gcv':
+            residual = target - TPS(source, target, alpha=alpha)(source)
+            # trace of the hat matrix from fitting every unit target
+            trace = 0
+            for i in range(p):
+                unit = numpy.zeros(source.shape)
+                unit[i, 0] = 1
+                trace += TPS(source, unit, alpha=alpha)(source[i:i+1])[0, 0]
+            scores.append(p *numpy.sum(residual **2) / (p - trace) **2)
+        else:
+            errors = []
+            for i in range(p):
+                keep = numpy.arange(p) != i
+                fitted = TPS(source[keep], target[keep], alpha=alpha)(source[i:i+1])
+                errors.append(numpy.sum((fitted - target[i]) **2))
+            scores.append(numpy.mean(errors))
+
+    assert numpy.allclose(selected.alpha_scores[0], alphas)
+    assert numpy.allclose(selected.alpha_scores[1], scores, rtol=1E-8)
+    assert 0 < numpy.argmin(scores) < len(alphas) -1
+    assert selected.alpha == alphas[numpy.argmin(scores)]
+    assert numpy.allclose(selected.coef, TPS(source, target, alpha=selected.alpha).coef)
@@ -0,0 +1,67 @@
+"""
+accuracy and cost of `ApproxTPS` against the exact `TPS` evaluator
+"""
+import numpy
+import pytest
+
+from sft import Stats, TPS
+from sft.embedding.tps_approx import ApproxTPS
+
+
+# rounding of the far field sums on top of the truncation bound
+ROUNDING = 1E-9
+
+
+@pytest.fixture(scope='module')
+def problem():
+    rng = numpy.random.RandomState(0)
+    source = rng.uniform(-10, 10, (2000, 2))
+    target = source + numpy.stack([
+        numpy.sin(source[:, 0] / 3), numpy.cos(source[:, 1] / 4)
+    ], axis=1)
+    query = rng.uniform(-10, 10, (5000, 2))
+    return TPS(source, target, alpha=1E-3), query
+
+
+@pytest.mark.parametrize('tol', [1E-2, 1E-4, 1E-6, 1E-8])
+def test_error_within_tol(problem, tol):
+    tps, query = problem
+    exact = tps(query)
+    approx = ApproxTPS(tps, tol)(query)
+    assert numpy.max(numpy.abs(approx - exact)) <= tol + ROUNDING *numpy.max(numpy.abs(exact))
+
+
+def test_looser_tol_is_cheaper(problem):
+    tps, query = problem
+    exact = tps(query)
+
+    errors = []
+    pairs = []
+    for tol in [1E0, 1E-2, 1E-4, 1E-6, 1E-8]:
+        stats = Stats()
+        approx = ApproxTPS(tps, tol, stats=stats)(query)
+        errors.append(numpy.max(numpy.abs(approx - exact)))
+        pairs.append(stats.counts['approx_exact_pairs'])
+
+        assert errors[-1] <= tol + ROUNDING *numpy.max(numpy.abs(exact))
+        assert stats.counts['approx_far_cells'] > 0
+
+    # a tighter tol sums more source and query pairs exactly and is not
+    # less accurate
+    slack = ROUNDING *numpy.max(numpy.abs(exact))
+    assert all(a < b for a, b in zip(pairs, pairs[1:]))
+    assert all(b <= a + slack for a, b in zip(errors, errors[1:]))
+    assert pairs[0] < len(query) *len(tps.source_points) / 4
+
+
+def test_jacobian_close(problem):
+    tps, query = problem
+    approx = ApproxTPS(tps, 1E-8)
+    assert numpy.allclose(approx.jacobian(query[:200]), tps.jacobian(query[:200]), atol=1E-5)
+
+
+def test_rejects_3d():
+    rng = numpy.random.RandomState(1)
+    source = rng.uniform(size=(20, 3))
+    with pytest.raises(ValueError):
+        ApproxTPS(TPS(source, source), 1E-6)
@@ -0,0 +1,46 @@
+"""
+`BatchedTPS` against independently fitted `TPS` models
+"""
+import numpy
+import pytest
+
+from sft import TPS, BatchedTPS
+
+
+@pytest.fixture(scope='module')
+def problems():
+    rng = numpy.random.RandomState(0)
+    source = rng.uniform(-5, 5, (6, 40, 3))
+    target = source + .3 *numpy.sin(source[..., ::-1]) + rng.normal(size=(6, 1, 3))
+    query = rng.uniform(-5, 5, (6, 300, 3))
+    return source, target, query
+
+
+@pytest.mark.parametrize('alpha', [0, 1E-2, 'each'])
+def test_members_equal_independent_fits(problems, alpha):
+    source, target, query = problems
+    if alpha == 'each':
+        alpha = numpy.logspace(-4, 1, len(source))
+
+    batched = BatchedTPS(source, target, alpha)
+    alphas = numpy.broadcast_to(alpha, (len(source),))
+    shared = batched(query[0], block_size=70)
+    separate = batched(query, block_size=70)
+
+    assert len(batched) == len(source)
+    for i in range(len(source)):
+        tps = TPS(source[i], target[i], alpha=alphas[i])
+        scale = numpy.max(numpy.abs(tps.coef))
+
+        assert numpy.allclose(batched.coef[i], tps.coef, rtol=1E-8, atol=1E-10 *scale)
+        assert numpy.allclose(batched[i].coef, tps.coef, rtol=1E-8, atol=1E-10 *scale)
+        assert numpy.allclose(shared[i], tps(query[0]))
+        assert numpy.allclose(separate[i], tps(query[i]))
+        assert numpy.allclose(batched[i](query[i]), tps(query[i]))
+
+
+def test_member_refits_like_a_fresh_fit(problems):
+    source, target, _ = problems
+    member = BatchedTPS(source, target, 1E-2)[2]
+    assert numpy.allclose(
+        member.refit(2 *target[2]).coef, TPS(source[2], 2 *target[2], alpha=1E-2).coef)
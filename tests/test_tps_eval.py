@@ -0,0 +1,67 @@
+"""
+blocked and parallel evaluation of `TPS`
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pytest
+
+from sft import TPS
+from sft.embedding.tps import EVAL_BLOCK_BYTES, _block_rows
+
+
+@pytest.fixture(scope='module')
+def tps():
+    rng = numpy.random.RandomState(0)
+    source = rng.uniform(-5, 5, (200, 3))
+    return TPS(source, source + .1 *numpy.sin(source))
+
+
+@pytest.fixture(scope='module')
+def query():
+    return numpy.random.RandomState(1).uniform(-5, 5, (5000, 3))
+
+
+def test_several_default_blocks(tps, query):
+    assert _block_rows(len(query), len(tps.source_points), max_bytes=EVAL_BLOCK_BYTES) < len(query) / 3
+
+
+@pytest.mark.parametrize('block_size', [None, 700])
+@pytest.mark.parametrize('workers, executor', [(3, 'thread'), (3, 'process')])
+def test_parallel_matches_serial(tps, query, block_size, workers, executor):
+    serial = tps(query, block_size=block_size)
+    assert numpy.array_equal(
+        tps(query, block_size=block_size, workers=workers, executor=executor), serial)
+
+
+def test_caller_executor(tps, query):
+    serial = tps(query, block_size=700)
+    with ProcessPoolExecutor(2) as pool:
+        for _ in range(2):
+            assert numpy.array_equal(
+                tps(query, block_size=700, workers=2, executor=pool), serial)
+
+
+def test_unknown_executor(tps, query):
+    with pytest.raises(ValueError):
+        tps(query, block_size=700, workers=2, executor='fiber')
+
+
+def test_default_blocks_outnumber_workers(monkeypatch):
+    rng = numpy.random.RandomState(2)
+    source = rng.uniform(-5, 5, (100, 3))
+    tps = TPS(source, source)
+    query = rng.uniform(-5, 5, (100000, 3))
+
+    blocks = []
+    evaluate = TPS._evaluate
+
+    def count(self, points, out):
+        blocks.append(len(points))
+        return evaluate(self, points, out)
+
+    monkeypatch.setattr(TPS, '_evaluate', count)
+    tps(query, workers=32)
+
+    assert len(blocks) >= 32
+    assert sum(blocks) == len(query)
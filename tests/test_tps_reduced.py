@@ -0,0 +1,80 @@
+"""
+approximate fits of `TPS` on fewer radial basis centers
+"""
+import pickle
+
+import numpy
+import pytest
+from scipy.linalg import null_space, sqrtm
+
+from sft import TPS
+from sft.embedding.tps import MAX_CENTER_FRACTION, pairwise_radial_basis
+
+
+@pytest.fixture
+def points():
+    rng = numpy.random.RandomState(0)
+    source = rng.uniform(-5, 5, (400, 2))
+    target = numpy.stack([
+        source[:, 0] + .1 *source[:, 1] **2,
+        source[:, 1] - .2 *numpy.sin(source[:, 0])
+    ], axis=1)
+    return source, target
+
+
+def test_pickle_drops_factorization(points):
+    source, target = points
+    tps = TPS(source, target, alpha=1E-3, centers=40)
+
+    data = pickle.dumps(tps)
+    # neither the O(p^2) factorization nor the O(p*c) basis is sent
+    assert len(data) < 2 *(source.nbytes +target.nbytes)
+
+    loaded = pickle.loads(data)
+    assert numpy.array_equal(loaded(source), tps(source))
+    assert numpy.allclose(loaded.refit(target).coef, tps.coef)
+    assert numpy.allclose(loaded.refit(2 *target).coef, tps.with_targets(2 *target).coef)
+
+
+def test_matches_constrained_least_squares(points):
+    source, target = points
+    alpha = 1E-2
+    tps = TPS(source, target, alpha=alpha, centers=40)
+
+    # the same problem solved by SVD in the null space of the side conditions
+    centers = tps.source_points
+    Z = null_space(numpy.hstack([numpy.ones((len(centers), 1)), centers]).T)
+    L = numpy.real(sqrtm(numpy.dot(Z.T, numpy.dot(pairwise_radial_basis(centers, centers), Z))))
+    A = numpy.vstack([
+        numpy.hstack([
+            numpy.dot(pairwise_radial_basis(source, centers), Z),
+            numpy.ones((len(source), 1)), source
+        ]),
+        numpy.hstack([numpy.sqrt(alpha) *L, numpy.zeros((len(L), 3))])
+    ])
+    Y = numpy.vstack([target, numpy.zeros((len(L), 2))])
+    x = numpy.linalg.lstsq(A, Y, rcond=None)[0]
+    coef = numpy.vstack([numpy.dot(Z, x[:len(L)]), x[len(L):]])
+
+    assert numpy.allclose(tps.coef, coef, rtol=0, atol=1E-10 *numpy.max(numpy.abs(coef)))
+
+
+def test_max_residual_adds_centers(points):
+    source, target = points
+    tps = TPS(source, target, centers=10, max_residual=1E-2)
+    assert tps.residual <= 1E-2
+    assert 10 < len(tps.source_points) <= MAX_CENTER_FRACTION *len(source)
+
+
+def test_unreachable_max_residual_warns(points):
+    source, _ = points
+    noise = numpy.random.RandomState(1).normal(size=source.shape)
+    with pytest.warns(RuntimeWarning, match='max_residual'):
+        tps = TPS(source, noise, centers=10, max_residual=1E-9)
+    assert len(tps.source_points) == int(MAX_CENTER_FRACTION *len(source))
+
+
+def test_max_residual_needs_centers(points):
+    source, target = points
+    with pytest.raises(ValueError):
+        TPS(source, target, max_residual=1E-2)
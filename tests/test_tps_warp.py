@@ -0,0 +1,97 @@
+"""
+matching and reduction of the keypoints of `TpsWarp`
+"""
+from collections import namedtuple
+
+import numpy
+import pytest
+
+from sft import TpsWarp
+from sft.embedding.tps_warp import match_arrays, match_points, reduce_matches
+
+
+KeyPoint = namedtuple('KeyPoint', 'pt')
+Match = namedtuple('Match', 'queryIdx trainIdx distance')
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_match_arrays_equals_match_points(seed):
+    rng = numpy.random.RandomState(seed)
+    k, l, m = rng.randint(1, 40, 3)
+
+    points_template = rng.uniform(-10, 10, (k, 2))
+    points_image = rng.uniform(-10, 10, (l, 2))
+    # few clusters, so that some have several matches and some none; the
+    # template keypoints repeat and the distances tie
+    labels = rng.randint(0, max(k // 3, 1), k)
+    query_idx = rng.randint(0, k, m)
+    train_idx = rng.randint(0, l, m)
+    distance = rng.randint(0, 4, m).astype(float)
+
+    expected = match_points(
+        [KeyPoint(tuple(p)) for p in points_template],
+        [KeyPoint(tuple(p)) for p in points_image],
+        [Match(q, t, d) for q, t, d in zip(query_idx, train_idx, distance)],
+        labels
+    )
+    result = match_arrays(points_template, points_image, query_idx, train_idx, distance, labels)
+
+    for a, b in zip(expected, result):
+        assert numpy.array_equal(a, b)
+
+
+def test_match_arrays_without_matches():
+    source_pt, target_pt = match_arrays(
+        numpy.zeros((3, 2)), numpy.zeros((3, 2)), [], [], [], [0, 1, 2])
+    assert source_pt.shape == target_pt.shape == (0, 2)
+
+
+@pytest.fixture
+def matched():
+    rng = numpy.random.RandomState(4)
+    source = rng.uniform(-10, 10, (500, 2))
+    target = source *1.5 + 1E-3 *rng.normal(size=source.shape)
+    return source, target
+
+
+def _check_reduced(source, target, reduced_source, reduced_target, n):
+    assert 0 < len(reduced_source) <= n
+    assert reduced_source.shape == reduced_target.shape
+    # means of clusters of an affine map with small noise
+    assert numpy.allclose(reduced_target, reduced_source *1.5, atol=.01)
+    assert numpy.all(reduced_source >= source.min(axis=0))
+    assert numpy.all(reduced_source <= source.max(axis=0))
+
+
+def test_reduce_matches_grid(matched):
+    source, target = matched
+    _check_reduced(source, target, *reduce_matches(source, target, 50, 'grid'), 50)
+
+
+def test_reduce_matches_kmeans(matched):
+    cluster = pytest.importorskip('sklearn.cluster')
+    source, target = matched
+
+    reduced_source, reduced_target = reduce_matches(source, target, 50, 'kmeans', random_state=3)
+    _check_reduced(source, target, reduced_source, reduced_target, 50)
+
+    # the means of the clusters found by MiniBatchKMeans
+    labels = cluster.MiniBatchKMeans(
+        n_clusters=50, batch_size=1024, n_init=1, random_state=3).fit_predict(source)
+    expected = numpy.array([source[labels == k].mean(axis=0) for k in numpy.unique(labels)])
+    assert numpy.allclose(reduced_source, expected)
+
+    # seeded, so the warp is repeatable
+    warps = [
+        TpsWarp.from_arrays(
+            source, target, numpy.arange(500), numpy.arange(500), numpy.zeros(500),
+            control_points=50, reduce='kmeans', random_state=3)
+        for _ in range(2)
+    ]
+    assert numpy.array_equal(warps[0]._tps.coef, warps[1]._tps.coef)
+
+
+def test_reduce_matches_unknown_method(matched):
+    source, target = matched
+    with pytest.raises(ValueError):
+        reduce_matches(source, target, 50, 'voronoi')
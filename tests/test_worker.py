@@ -0,0 +1,85 @@
+"""
+`demo.worker.BackgroundSolver` without a display
+"""
+import os
+import threading
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+
+from demo.worker import BackgroundSolver
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def _deliver(app, solver):
+    assert solver.wait(10000)
+    for _ in range(10):
+        app.processEvents()
+
+
+@pytest.mark.parametrize('checks_progress', [False, True])
+def test_only_latest_result_is_delivered(app, checks_progress):
+    solver = BackgroundSolver()
+    finished = []
+    failed = []
+    solver.finished.connect(finished.append)
+    solver.failed.connect(failed.append)
+
+    release = threading.Event()
+    ran = []
+
+    def first(progress):
+        assert release.wait(10)
+        if checks_progress:
+            # a cancelled run stops here
+            progress('still running')
+        ran.append('first')
+        return 'first'
+
+    def second(progress):
+        progress('solving')
+        ran.append('second')
+        return 'second'
+
+    solver.start(first)
+    solver.start(second)
+    release.set()
+    _deliver(app, solver)
+
+    assert finished == ['second']
+    assert failed == []
+    assert not solver.busy()
+    if checks_progress:
+        # stopped at its progress report
+        assert ran == ['second']
+    else:
+        # ran to the end, but its result was dropped
+        assert sorted(ran) == ['first', 'second']
+
+
+def test_failure_of_a_superseded_run_is_dropped(app):
+    solver = BackgroundSolver()
+    finished = []
+    failed = []
+    solver.finished.connect(finished.append)
+    solver.failed.connect(failed.append)
+
+    release = threading.Event()
+
+    def broken(progress):
+        assert release.wait(10)
+        raise RuntimeError('stale')
+
+    solver.start(broken)
+    solver.start(lambda progress: 'latest')
+    release.set()
+    _deliver(app, solver)
+
+    assert finished == ['latest']
+    assert failed == []